@@ -0,0 +1,142 @@
+"""Collection throughput benchmark against the local FakeXTB server.
+
+Usage (from src/):
+    python -m bench.bench_collect --rounds 5 --latency 0.05
+    python -m bench.bench_collect --pgsql --task   # also drive Postgres and collect_candles
+
+--pgsql and --task need the Postgres/Redis/Mongo services of compose.yaml.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from project.spider.fakextb import FakeXTBServer
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+class Stage:
+    """Latency samples and candle count of one benchmark stage"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.samples: list[float] = []
+        self.candles = 0
+
+    def time(self, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.samples.append(time.perf_counter() - started)
+        return result
+
+    def report(self) -> str:
+        total = sum(self.samples)
+        rate = self.candles / total if total else 0.0
+        return (f"{self.name:<24} calls={len(self.samples):>5} candles={self.candles:>8} "
+                f"candles/s={rate:>10.0f} p50={percentile(self.samples, 0.5) * 1000:>8.1f}ms "
+                f"p99={percentile(self.samples, 0.99) * 1000:>8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--pgsql', action='store_true', help="include upsert_candles stage")
+    parser.add_argument('--task', action='store_true', help="include collect_candles stage")
+    args = parser.parse_args()
+
+    fake = FakeXTBServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate).start()
+    # Config reads the environment on first access, before any project import uses it
+    os.environ['XTB_URL'] = fake.url
+    # the fake server takes any login, the task stage needs a configured account
+    accounts = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump({'bench': {'pass': ''}}, accounts)
+    accounts.close()
+    os.environ['XTB_ACCOUNT_FILE'] = accounts.name
+    os.environ['WORKER_ID'] = 'bench'
+
+    from project.spider.crud import (
+        _get_chart_from_ts, gather_present_candles_many, async_gather_present_candles,
+        upsert_candles
+    )
+    from project.spider.exchange import Exchange
+    from project.spider.columnar import Candles
+    from project.spider.schemas import CandleStatBase
+    from project.spider.XTBApi import Client, AsyncClient
+
+    pairs = Exchange.SYMBOL_DEFAULT
+    today = datetime.now(timezone.utc).date()
+    cts = [
+        CandleStatBase(
+            symbol_id=Exchange.SYMBOL_ID[symbol], timeframe_id=Exchange.PERIOD_ID[period],
+            symbol=symbol, period=period, digits=0, date_from=today, date_until=today
+        )
+        for symbol, period in pairs
+    ]
+    client = Client('bench', token='', mode='real', url=fake.url)
+    client.login()
+
+    sequential = Stage('xtb.sequential')
+    pipelined = Stage('xtb.pipelined')
+    concurrent = Stage('xtb.async')
+    rows = Stage('columnar.rows')
+    upsert = Stage('db.upsert_candles')
+    task = Stage('task.collect_candles')
+
+    async def gather_async():
+        aclient = AsyncClient('bench', token='', mode='real', url=fake.url)
+        await aclient.login()
+        try:
+            return await async_gather_present_candles(cts, aclient)
+        finally:
+            await aclient.logout()
+
+    def build_rows(ct: CandleStatBase, candles: Candles):
+        return candles.rows(ct.symbol_id, ct.timeframe_id)
+
+    for _ in range(args.rounds):
+        ts = int(time.time())
+        for ct in cts:
+            candles, _ = sequential.time(_get_chart_from_ts, client, ts, ct.symbol, ct.period, -300)
+            sequential.candles += len(candles)
+            rows.time(build_rows, ct, candles)
+            rows.candles += len(candles)
+            if args.pgsql:
+                upsert.time(upsert_candles, ct.symbol_id, ct.timeframe_id, candles)
+                upsert.candles += len(candles)
+
+        results = pipelined.time(gather_present_candles_many, cts, client)
+        pipelined.candles += sum(len(candles) for candles, _ in results)
+
+        results = concurrent.time(asyncio.run, gather_async())
+        concurrent.candles += sum(len(candles) for candles, _ in results)
+
+        if args.task:
+            from project.spider.tasks import collect_candles
+            for symbol, period in pairs:
+                res = task.time(collect_candles.apply, (symbol, period))
+                # candles fetched by the task, None when nothing was new
+                if res.successful() and res.result:
+                    task.candles += res.result.get('candles', 0)
+
+    client.close()
+    fake.stop()
+    os.unlink(accounts.name)
+
+    print(f"pairs={len(pairs)} rounds={args.rounds} latency={args.latency}s commands={fake.commands}")
+    for stage in (sequential, pipelined, concurrent, rows, upsert, task):
+        if stage.samples:
+            print(stage.report())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Import-time benchmark of the process entry points.
+
+Usage (from src/):
+    python -m bench.bench_import --repeat 5
+    python -m bench.bench_import --module project.fast --top 15   # slowest imports of one module
+
+Each import runs in a fresh interpreter, under -X importtime.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+MODULES = ('project.config', 'project.database', 'project.spider.exchange', 'project.worker', 'project.fast')
+
+
+def import_profile(module: str) -> tuple[float, list[tuple[int, int, str]]]:
+    """Return: wall time (s) of importing module in a fresh interpreter,
+    and its (self us, cumulative us, package) -X importtime rows."""
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, env=os.environ.copy(),
+    )
+    elapsed = time.perf_counter() - started
+    if proc.returncode:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, package = line[len('import time:'):].split('|')
+        rows.append((int(self_us), int(cumulative_us), package.rstrip()))
+    return elapsed, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--module', action='append', help="module to import, repeatable")
+    parser.add_argument('--top', type=int, default=0, help="show the slowest imports by cumulative time")
+    args = parser.parse_args()
+
+    for module in args.module or MODULES:
+        try:
+            runs = [import_profile(module) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{module:<28} {e}")
+            continue
+        walls = sorted(wall for wall, _ in runs)
+        rows = runs[0][1]
+        cumulative = max((c for _, c, _ in rows), default=0)
+        print(f"{module:<28} wall p50={walls[len(walls) // 2] * 1000:>8.1f}ms "
+              f"min={walls[0] * 1000:>8.1f}ms importtime={cumulative / 1000:>8.1f}ms modules={len(rows)}")
+        for self_us, cumulative_us, package in sorted(rows, key=lambda r: -r[1])[:args.top]:
+            print(f"    {cumulative_us / 1000:>8.1f}ms cumulative {self_us / 1000:>8.1f}ms self {package}")
+
+
+if __name__ == '__main__':
+    main()
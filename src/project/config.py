@@ -1,28 +1,56 @@
-from pydantic.dataclasses import dataclass
+from typing import Any, Callable
+
 from decouple import config
 
 
-@dataclass
+class _Setting:
+    """Setting read from the environment on first access, then cached as a plain class attribute."""
+
+    def __init__(self, load: Callable[[], Any]) -> None:
+        self._load = load
+
+    def __set_name__(self, owner, name: str):
+        self._name = name
+
+    def __get__(self, obj, owner):
+        value = self._load()
+        setattr(owner, self._name, value)
+        return value
+
+
 class Config:
     DEBUG: bool = False
-    REDIS_HOST: str = config("REDIS_HOST", default="localhost")
-    REDIS_URI: str = "redis://%s:%s/%s" % (
+    REDIS_HOST: str = _Setting(lambda: config("REDIS_HOST", default="localhost"))
+    REDIS_URI: str = _Setting(lambda: "redis://%s:%s/%s" % (
         config("REDIS_HOST", default="localhost"),
         config("REDIS_PORT", default="6379"),
         config("REDIS_DBNUM", default="0"),
-    )
-    PGSQL_URI: str = "postgresql://%s:%s@%s/%s" % (
+    ))
+    PGSQL_URI: str = _Setting(lambda: "postgresql://%s:%s@%s/%s" % (
         config("PGSQL_USER", default="user"),
         config("PGSQL_PASS", default="password"),
         config("PGSQL_HOST", default="localhost"),
         config("PGSQL_DATABASE", default="mydb"),
-    )
-    MONGODB_NAME: str = config("MONGODB_NAME", default="test")
-    MONGO_URI: str = "mongodb://%s:%s@%s" % (
+    ))
+    PGSQL_POOL_SIZE: int = _Setting(lambda: config("PGSQL_POOL_SIZE", default=10, cast=int))
+    REDIS_POOL_SIZE: int = _Setting(lambda: config("REDIS_POOL_SIZE", default=20, cast=int))
+    MONGO_POOL_SIZE: int = _Setting(lambda: config("MONGO_POOL_SIZE", default=20, cast=int))
+    POOL_TIMEOUT: float = _Setting(lambda: config("POOL_TIMEOUT", default=10.0, cast=float))
+    RING_CAPACITY: int = _Setting(lambda: config("RING_CAPACITY", default=1000, cast=int))
+    # empty: account.json next to spider/exchange.py, where the example ships
+    XTB_ACCOUNT_FILE: str = _Setting(lambda: config("XTB_ACCOUNT_FILE", default=""))
+    XTB_URL: str = _Setting(lambda: config("XTB_URL", default=""))
+    XTB_POOL: bool = _Setting(lambda: config("XTB_POOL", default=False, cast=bool))
+    XTB_STREAM: bool = _Setting(lambda: config("XTB_STREAM", default=False, cast=bool))
+    XTB_RESAMPLE: bool = _Setting(lambda: config("XTB_RESAMPLE", default=False, cast=bool))
+    XTB_TA_COMBINED: bool = _Setting(lambda: config("XTB_TA_COMBINED", default=True, cast=bool))
+    PGSQL_RETENTION_YEARS: int = _Setting(lambda: config("PGSQL_RETENTION_YEARS", default=0, cast=int))
+    MONGODB_NAME: str = _Setting(lambda: config("MONGODB_NAME", default="test"))
+    MONGO_URI: str = _Setting(lambda: "mongodb://%s:%s@%s" % (
         config("MONGODB_USER", default="user"),
         config("MONGODB_PASS", default="password"),
         config("MONGODB_HOST", default="localhost"),
-    )
+    ))
 
 
 LOGGING = {
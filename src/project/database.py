@@ -1,21 +1,182 @@
+import os
+import threading
+import time
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
 from contextlib import contextmanager
-from redis import Redis
-from motor.motor_asyncio import AsyncIOMotorClient
+from typing import TYPE_CHECKING
+from redis import Redis, BlockingConnectionPool
 from .config import Config
 
+if TYPE_CHECKING:
+    from pymongo import MongoClient
+    from motor.motor_asyncio import AsyncIOMotorClient
+
 DATABASE = Config.PGSQL_URI
 
-engine = create_engine(DATABASE)
-SessionLocal = sessionmaker(bind=engine)
+# engines and clients are created on first use, not at import
+SessionLocal = sessionmaker()
 Base = declarative_base()
 
 
+class _CountingPool(ThreadedConnectionPool):
+    created = 0
+
+    def _connect(self, key=None):
+        self.created += 1
+        return super()._connect(key)
+
+
+class PgPool:
+    """Bounded, thread-safe psycopg2 pool. Callers wait up to `timeout` seconds
+    for a free connection; connections idle longer than `check_after` seconds
+    are pinged on checkout and replaced when dead."""
+
+    def __init__(self, dsn: str, size: int, timeout: float, check_after: float = 30.0) -> None:
+        self.size = size
+        self.timeout = timeout
+        self.check_after = check_after
+        self._pool = _CountingPool(0, size, dsn)
+        # open lazily, but keep every returned connection
+        self._pool.minconn = size
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle_since: dict[int, float] = {}
+        self.in_use = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.closed = 0
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - self._idle_since.get(id(conn), 0.0) < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Return: a healthy connection, waiting for a free slot."""
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError(f"no Postgres connection free within {self.timeout}s")
+        waited = time.monotonic() - start
+        try:
+            conn = self._pool.getconn()
+            while not self._healthy(conn):
+                self._pool.putconn(conn, close=True)
+                self.closed += 1
+                conn = self._pool.getconn()
+            with self._lock:
+                self.in_use += 1
+                self.waits += waited > 0.001
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+        except Exception:
+            self._slots.release()
+            raise
+        return conn
+
+    def putconn(self, conn):
+        """Give back conn, rolled back if a transaction was left open."""
+        close = bool(conn.closed)
+        if not close and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                close = True
+        with self._lock:
+            self._idle_since[id(conn)] = time.monotonic()
+            if close:
+                self._idle_since.pop(id(conn), None)
+                self.closed += 1
+            self._pool.putconn(conn, close=close)
+            self.in_use -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size, "in_use": self.in_use, "idle": len(self._pool._pool),
+            "waits": self.waits, "wait_time": round(self.wait_time, 3), "max_wait": round(self.max_wait, 3),
+            "created": self._pool.created, "closed": self.closed,
+        }
+
+
+_pools: dict = {}
+_pools_lock = threading.Lock()
+# parent's pools, kept referenced so that garbage collection never closes its sessions
+_inherited: list[dict] = []
+
+
+def _shared(name: str, factory):
+    """Return: the process-wide `name` resource, created once by factory."""
+    if name not in _pools:
+        with _pools_lock:
+            if name not in _pools:
+                _pools[name] = factory()
+    return _pools[name]
+
+
+def _reset_after_fork():
+    """Drop pools inherited from the parent without closing its sockets."""
+    global _pools_lock
+    _inherited.append(dict(_pools))
+    _pools.clear()
+    _pools_lock = threading.Lock()
+    if "engine" in _inherited[-1]:
+        _inherited[-1]["engine"].dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_engine() -> Engine:
+    return _shared("engine", lambda: create_engine(
+        DATABASE,
+        pool_size=Config.PGSQL_POOL_SIZE,
+        max_overflow=0,
+        pool_timeout=Config.POOL_TIMEOUT,
+        pool_pre_ping=True,
+    ))
+
+
+def __getattr__(name: str):
+    # `from .database import engine` keeps working, lazily
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def pg_pool() -> PgPool:
+    return _shared("pg", lambda: PgPool(DATABASE, Config.PGSQL_POOL_SIZE, Config.POOL_TIMEOUT))
+
+
+def redis_pool() -> BlockingConnectionPool:
+    return _shared("redis", lambda: BlockingConnectionPool(
+        host=Config.REDIS_HOST, decode_responses=True,
+        max_connections=Config.REDIS_POOL_SIZE, timeout=Config.POOL_TIMEOUT,
+        health_check_interval=30,
+    ))
+
+
+def mongo_client() -> "MongoClient":
+    from pymongo import MongoClient
+    return _shared("mongo", lambda: MongoClient(Config.MONGO_URI, maxPoolSize=Config.MONGO_POOL_SIZE))
+
+
 @contextmanager
 def db_session() -> Session:
-    session = SessionLocal()
+    session = SessionLocal(bind=get_engine())
     try:
         yield session
     finally:
@@ -24,16 +185,37 @@ def db_session() -> Session:
 
 @contextmanager
 def db_conn() -> psycopg2._psycopg.connection:
-    conn = psycopg2.connect(DATABASE)
+    pool = pg_pool()
+    conn = pool.getconn()
     try:
         yield conn
     finally:
-        conn.close()
+        pool.putconn(conn)
 
 
 def redis_conn() -> Redis:
-    return Redis(Config.REDIS_HOST, decode_responses=True)
+    return Redis(connection_pool=redis_pool())
+
+
+async def mongo_conn() -> "AsyncIOMotorClient":
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(Config.MONGO_URI, maxPoolSize=Config.MONGO_POOL_SIZE)
 
 
-async def mongo_conn() -> AsyncIOMotorClient:
-    return AsyncIOMotorClient(Config.MONGO_URI)
+def pool_stats() -> dict:
+    """Return: usage of the process-wide Postgres, Redis and Mongo pools."""
+    stats = {"pid": os.getpid()}
+    if "engine" in _pools:
+        pool = _pools["engine"].pool
+        stats["sqlalchemy"] = {"size": pool.size(), "in_use": pool.checkedout(), "idle": pool.checkedin()}
+    if "pg" in _pools:
+        stats["pg"] = _pools["pg"].stats()
+    if "redis" in _pools:
+        pool = _pools["redis"]
+        stats["redis"] = {
+            "size": pool.max_connections, "in_use": pool.max_connections - pool.pool.qsize(),
+            "created": len(pool._connections),
+        }
+    if "mongo" in _pools:
+        stats["mongo"] = {"size": Config.MONGO_POOL_SIZE, "nodes": len(_pools["mongo"].nodes)}
+    return stats
@@ -1,17 +1,36 @@
+import asyncio
+import time
+from celery import states
 from celery.result import AsyncResult
 from fastapi import FastAPI
-from .database import engine
+from fastapi.concurrency import run_in_threadpool
+from .database import get_engine, pool_stats
 from .spider.models import Base
-from .spider.route import router as SpiderRouter
+from .spider.migrations import apply_migrations
+from .spider.route import router as SpiderRouter, warm_rings
+from .spider.schemas import TaskIds
+from .worker import app as celery_app
 # from .jarvis.route import router as JarvisRouter
 
 
-Base.metadata.create_all(bind=engine)
 app = FastAPI()
 app.include_router(SpiderRouter, tags=["Spider"], prefix="/candles")
 # app.include_router(JarvisRouter, tags=["Jarvis"], prefix="/fx")
 
 
+@app.on_event("startup")
+def init_db():
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine)
+    apply_migrations(engine)
+
+
+@app.on_event("startup")
+async def init_rings():
+    # after init_db, handlers run in registration order
+    await warm_rings()
+
+
 @app.get("/", tags=["Root"])
 async def read_root():
     """
@@ -20,6 +39,14 @@ async def read_root():
     return {"message": "Welcome Home!"}
 
 
+@app.get("/pools", tags=["Root"])
+def read_pools():
+    """
+    Connection pools usage of this API process
+    """
+    return pool_stats()
+
+
 @app.get("/tasks/{task_id}")
 def task_status(task_id: str):
     """
@@ -45,3 +72,38 @@ def task_status(task_id: str):
             "state": state,
         }
     return response
+
+
+MAX_WAIT = 60.0
+POLL_INTERVAL = 0.5
+
+
+def tasks_states(task_ids: list[str]) -> dict[str, dict]:
+    """Fetch states of many tasks from the Redis result backend in one MGET."""
+    if not task_ids:
+        return {}
+    backend = celery_app.backend
+    values = backend.client.mget([backend.get_key_for_task(task_id) for task_id in task_ids])
+    response = {}
+    for task_id, value in zip(task_ids, values):
+        meta = backend.decode_result(value) if value else {"status": states.PENDING}
+        state = meta["status"]
+        response[task_id] = {"state": state}
+        if state == states.FAILURE:
+            response[task_id]["error"] = str(meta.get("result"))
+    return response
+
+
+@app.post("/tasks/status")
+async def tasks_status(body: TaskIds):
+    """
+    Get states of many tasks at once.
+    With wait > 0, long-poll up to wait seconds (at most 60) until all of them are ready.
+    """
+    deadline = time.monotonic() + min(body.wait, MAX_WAIT)
+    while True:
+        response = await run_in_threadpool(tasks_states, body.task_ids)
+        done = all(s["state"] in states.READY_STATES for s in response.values())
+        if done or time.monotonic() >= deadline:
+            return {"done": done, "tasks": response}
+        await asyncio.sleep(POLL_INTERVAL)
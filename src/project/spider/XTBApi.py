@@ -1,12 +1,25 @@
+import asyncio
 import enum
+import itertools
 import json
+import threading
+import time
+import orjson
 from websockets.sync.client import ClientConnection, connect
+from websockets.asyncio.client import ClientConnection as AsyncClientConnection
+from websockets.asyncio.client import connect as async_connect
 from websockets.exceptions import WebSocketException
 import logging
 LOGGER = logging.getLogger('XTBApi')
 LOGGER.setLevel(logging.INFO)
 
 SERVER_URL = "ws.xtb.com"
+COMMAND_INTERVAL = 0.2  # server-side minimum gap between commands, in seconds
+KEEPALIVE_INTERVAL = 60.0
+RECONNECT_RETRIES = 3
+RECONNECT_BACKOFF = 1.0
+LATENCY_ALPHA = 0.2
+LOGOUT_TIMEOUT = 5.0  # seconds to wait for the logout response before dropping the socket
 
 
 # #
@@ -66,27 +79,86 @@ def _construct_cmd(command: str, **kwargs):
     return cmd
 
 
+def _chart_range_cmd(symbol: str, period: int, start: int, end: int, ticks: int):
+    """helper function to construct getChartRangeRequest command"""
+    return _construct_cmd(
+        "getChartRangeRequest",
+        info={
+            "symbol": symbol,
+            "period": period,
+            "start": start * 1000,
+            "end": end * 1000,
+            "ticks": ticks
+        }
+    )
+
+
 class BaseClient(object):
     """Base client class"""
 
-    def __init__(self, user: str, token: str, mode: str) -> None:
+    def __init__(self, user: str, token: str, mode: str, url: str | None = None) -> None:
         self.ws: ClientConnection | None = None
-        self.ws_uri = f'wss://{SERVER_URL}/{mode}'
+        self.ws_uri = f'{url or "wss://" + SERVER_URL}/{mode}'
         self._user = user
         self._token = token
         self.status = STATUS.NOT_LOGGED
+        self.stream_session_id: str | None = None
+        self._tags = itertools.count(1)
+        self._last_sent = 0.0
+        self._lock = threading.RLock()
+        self._keepalive: threading.Thread | None = None
+        self._stop = threading.Event()
+        # session health
+        self.connected_at = 0.0
+        self.reconnects = 0
+        self.commands = 0
+        self.latency = 0.0
+        self.latency_avg = 0.0
         LOGGER.debug("BaseClient inited")
         self.LOGGER = logging.getLogger('XTBApi.BaseClient')
 
+    @property
+    def connection_age(self) -> float:
+        """seconds since the socket was opened"""
+        return time.monotonic() - self.connected_at if self.ws else 0.0
+
+    def health(self) -> dict:
+        """session health stats"""
+        return {
+            "status": self.status.name,
+            "age": round(self.connection_age, 1),
+            "reconnects": self.reconnects,
+            "commands": self.commands,
+            "latency": round(self.latency, 4),
+            "latency_avg": round(self.latency_avg, 4),
+        }
+
+    def _throttle(self):
+        """wait until the minimum gap since the previous command has passed"""
+        wait = self._last_sent + COMMAND_INTERVAL - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_sent = time.monotonic()
+
+    def _track_latency(self, started: float, n: int = 1):
+        """update command latency stats"""
+        self.latency = (time.monotonic() - started) / n
+        self.latency_avg += LATENCY_ALPHA * (self.latency - self.latency_avg)
+        self.commands += n
+
     def _send_command(self, data: dict):
         """send command to api"""
-        try:
-            self.ws.send(json.dumps(data))
-            response = self.ws.recv()
-        except WebSocketException:
-            raise SocketError()
+        with self._lock:
+            try:
+                self._throttle()
+                started = time.monotonic()
+                self.ws.send(json.dumps(data))
+                response = self.ws.recv()
+            except WebSocketException:
+                raise SocketError()
+            self._track_latency(started)
 
-        res = json.loads(response)
+        res = orjson.loads(response)
         if not res['status']:
             self.LOGGER.debug(res)
             raise CommandFailed(res)
@@ -95,13 +167,78 @@ class BaseClient(object):
         self.LOGGER.debug(res)
         return res
 
+    def _send_pipelined(self, commands: list[dict]) -> list[dict]:
+        """send tagged commands back to back, match responses by customTag.
+        Return: responses in the order of commands, failed ones included."""
+        if not commands:
+            return []
+        tags = [f"t{next(self._tags)}" for _ in commands]
+        responses = {}
+        with self._lock:
+            try:
+                started = time.monotonic()
+                for tag, data in zip(tags, commands):
+                    self._throttle()
+                    self.ws.send(json.dumps({**data, "customTag": tag}))
+                while len(responses) < len(tags):
+                    res = orjson.loads(self.ws.recv())
+                    tag = res.get('customTag')
+                    if tag not in tags:
+                        self.LOGGER.debug(f"CMD: unmatched response {res}")
+                        continue
+                    responses[tag] = res
+            except WebSocketException:
+                raise SocketError()
+            self._track_latency(started, len(tags))
+
+        for tag in tags:
+            if not responses[tag]['status']:
+                self.LOGGER.error(f"CMD: {tag} failed - {responses[tag].get('errorDescr')}")
+        self.LOGGER.info(f"CMD: pipelined {len(tags)} done")
+        return [responses[tag] for tag in tags]
+
+    def _connect(self):
+        """open a new socket, closing the stale one"""
+        self._close_ws()
+        try:
+            self.ws = connect(self.ws_uri)
+        except (WebSocketException, OSError):
+            raise SocketError()
+        self.connected_at = time.monotonic()
+
+    def _close_ws(self):
+        """close the socket, ignoring errors of an already dropped one"""
+        if self.ws is None:
+            return
+        try:
+            self.ws.close()
+        except (WebSocketException, OSError):
+            pass
+        self.ws = None
+
     def login(self):
         """login command"""
         cmd = _construct_cmd('login', userId=self._user, password=self._token)
-        self.ws = connect(self.ws_uri)
-        self.status = STATUS.LOGGED
-        self.LOGGER.info("CMD: login...")
-        return self._send_command(cmd)
+        with self._lock:
+            self._connect()
+            self.status = STATUS.LOGGED
+            self.LOGGER.info("CMD: login...")
+            res = self._send_command(cmd)
+        self.stream_session_id = res.get('streamSessionId')
+        return res
+
+    def reconnect(self, retries: int = RECONNECT_RETRIES, backoff: float = RECONNECT_BACKOFF):
+        """login again on a new socket, with exponential backoff"""
+        for attempt in range(retries):
+            try:
+                res = self.login()
+                self.reconnects += 1
+                return res
+            except (CommandFailed, SocketError):
+                self.status = STATUS.NOT_LOGGED
+                if attempt + 1 == retries:
+                    raise
+                time.sleep(backoff * 2 ** attempt)
 
     def logout(self):
         """logout command"""
@@ -110,34 +247,254 @@ class BaseClient(object):
         self.LOGGER.info("CMD: logout...")
         return self._send_command(cmd)
 
+    def close(self):
+        """stop keepalive and close the socket"""
+        self._stop.set()
+        with self._lock:
+            self._close_ws()
+        self.status = STATUS.NOT_LOGGED
+
+    def ping(self):
+        """ping command"""
+        cmd = _construct_cmd('ping')
+        self.LOGGER.debug("CMD: ping...")
+        return self._send_command(cmd)
+
+    def start_keepalive(self, interval: float = KEEPALIVE_INTERVAL):
+        """ping in background when idle for `interval` seconds, reconnect if it fails"""
+        if self._keepalive is not None and self._keepalive.is_alive():
+            return
+        self._stop.clear()
+        self._keepalive = threading.Thread(
+            target=self._keepalive_loop, args=(interval,),
+            name=f"XTBApi-keepalive-{self._user}", daemon=True
+        )
+        self._keepalive.start()
+
+    def _keepalive_loop(self, interval: float):
+        while not self._stop.wait(interval / 4):
+            if self.status != STATUS.LOGGED or time.monotonic() - self._last_sent < interval:
+                continue
+            try:
+                self.ping()
+            except (CommandFailed, SocketError):
+                try:
+                    self.reconnect()
+                except (CommandFailed, SocketError) as err:
+                    self.LOGGER.error(f"keepalive: {err}")
+
 
 class Client(BaseClient):
     """advanced class of client"""
-    def __init__(self, user: str, token: str, mode: str):
-        super().__init__(user, token, mode)
+    def __init__(self, user: str, token: str, mode: str, url: str | None = None):
+        super().__init__(user, token, mode, url)
         self.LOGGER = logging.getLogger('XTBApi.Client')
         self.LOGGER.info("Client inited")
 
     def get_server_time(self):
-        """logout command"""
+        """getServerTime command"""
         cmd = _construct_cmd('getServerTime')
-        self.status = STATUS.NOT_LOGGED
         self.LOGGER.info("CMD: get server time...")
         return self._send_command(cmd)
 
     def get_chart_range_request(self, symbol: str, period: int, start: int, end: int, ticks: int):
         """getChartRangeRequest command"""
-        cmd = _construct_cmd(
-            "getChartRangeRequest",
-            info={
-                "symbol": symbol,
-                "period": period,
-                "start": start * 1000,
-                "end": end * 1000,
-                "ticks": ticks
-            }
-        )
+        cmd = _chart_range_cmd(symbol, period, start, end, ticks)
         self.LOGGER.info(f"CMD: get chart range request for {symbol} of "
                          f"{period} from {start} to {end} with ticks of "
                          f"{ticks}...")
         return self._send_command(cmd)
+
+    def get_symbol(self, symbol: str):
+        """getSymbol command"""
+        cmd = _construct_cmd('getSymbol', symbol=symbol)
+        self.LOGGER.info(f"CMD: get symbol {symbol}...")
+        return self._send_command(cmd)
+
+    def get_chart_range_requests(self, infos: list[tuple[str, int, int, int, int]]):
+        """pipelined getChartRangeRequest commands,
+        infos: list of (symbol, period, start, end, ticks)"""
+        cmds = [_chart_range_cmd(*info) for info in infos]
+        self.LOGGER.info(f"CMD: get chart range requests for {len(cmds)} charts...")
+        return self._send_pipelined(cmds)
+
+
+class StreamClient(object):
+    """Streaming client, subscribes with the streamSessionId of a logged-in Client"""
+
+    def __init__(self, stream_session_id: str, mode: str, url: str | None = None) -> None:
+        self.ws: ClientConnection | None = None
+        self.ws_uri = f'{url or "wss://" + SERVER_URL}/{mode}Stream'
+        self._stream_session_id = stream_session_id
+        self.LOGGER = logging.getLogger('XTBApi.StreamClient')
+
+    def _send(self, command: str, **kwargs):
+        """send streaming command, no response is returned"""
+        data = {"command": command, "streamSessionId": self._stream_session_id, **kwargs}
+        try:
+            self.ws.send(json.dumps(data))
+        except WebSocketException:
+            raise SocketError()
+
+    def connect(self):
+        """open streaming socket"""
+        try:
+            self.ws = connect(self.ws_uri)
+        except (WebSocketException, OSError):
+            raise SocketError()
+        self.LOGGER.info("STREAM: connected")
+
+    def close(self):
+        """close streaming socket"""
+        if self.ws is not None:
+            self.ws.close()
+        self.LOGGER.info("STREAM: closed")
+
+    def ping(self):
+        """ping streaming command"""
+        self._send('ping')
+
+    def get_candles(self, symbol: str):
+        """subscribe to M1 candles of symbol"""
+        self.LOGGER.info(f"STREAM: subscribe candles of {symbol}")
+        self._send('getCandles', symbol=symbol)
+
+    def stop_candles(self, symbol: str):
+        """unsubscribe from candles of symbol"""
+        self.LOGGER.info(f"STREAM: unsubscribe candles of {symbol}")
+        self._send('stopCandles', symbol=symbol)
+
+    def recv(self, timeout: float | None = None) -> dict | None:
+        """receive one streamed message. Return: None on timeout."""
+        try:
+            return orjson.loads(self.ws.recv(timeout=timeout))
+        except TimeoutError:
+            return None
+        except WebSocketException:
+            raise SocketError()
+
+
+class AsyncBaseClient(object):
+    """Base asyncio client class, commands are multiplexed by customTag"""
+
+    def __init__(self, user: str, token: str, mode: str, url: str | None = None) -> None:
+        self.ws: AsyncClientConnection | None = None
+        self.ws_uri = f'{url or "wss://" + SERVER_URL}/{mode}'
+        self._user = user
+        self._token = token
+        self.status = STATUS.NOT_LOGGED
+        self._tags = itertools.count(1)
+        self._last_sent = 0.0
+        self._send_lock = asyncio.Lock()
+        self._pending: dict[str, asyncio.Future] = {}
+        self._reader: asyncio.Task | None = None
+        LOGGER.debug("AsyncBaseClient inited")
+        self.LOGGER = logging.getLogger('XTBApi.AsyncBaseClient')
+
+    async def _throttle(self):
+        """wait until the minimum gap since the previous command has passed"""
+        wait = self._last_sent + COMMAND_INTERVAL - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self._last_sent = time.monotonic()
+
+    async def _read_loop(self):
+        """dispatch responses to waiting commands by customTag"""
+        try:
+            async for message in self.ws:
+                res = orjson.loads(message)
+                fut = self._pending.get(res.get('customTag'))
+                if fut is None or fut.done():
+                    self.LOGGER.debug(f"CMD: unmatched response {res}")
+                    continue
+                fut.set_result(res)
+        except WebSocketException as err:
+            self.LOGGER.debug(err)
+        finally:
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(SocketError())
+
+    async def _send_command(self, data: dict):
+        """send command to api, wait for the response with the same tag"""
+        tag = f"t{next(self._tags)}"
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[tag] = fut
+        try:
+            async with self._send_lock:
+                await self._throttle()
+                await self.ws.send(json.dumps({**data, "customTag": tag}))
+            res = await fut
+        except WebSocketException:
+            raise SocketError()
+        finally:
+            self._pending.pop(tag, None)
+
+        if not res['status']:
+            self.LOGGER.debug(res)
+            raise CommandFailed(res)
+
+        self.LOGGER.info("CMD: done")
+        self.LOGGER.debug(res)
+        return res
+
+    async def close(self):
+        """close the socket without logging out, stop the reader"""
+        self.status = STATUS.NOT_LOGGED
+        if self.ws is not None:
+            try:
+                await self.ws.close()
+            except (WebSocketException, OSError):
+                pass
+            self.ws = None
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+
+    async def login(self):
+        """login command, the socket is closed again if it fails"""
+        cmd = _construct_cmd('login', userId=self._user, password=self._token)
+        try:
+            self.ws = await async_connect(self.ws_uri)
+        except (WebSocketException, OSError):
+            raise SocketError()
+        self._reader = asyncio.create_task(self._read_loop())
+        self.status = STATUS.LOGGED
+        self.LOGGER.info("CMD: login...")
+        try:
+            return await self._send_command(cmd)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def logout(self, timeout: float = LOGOUT_TIMEOUT):
+        """logout command, waiting at most timeout seconds before closing the socket"""
+        cmd = _construct_cmd('logout')
+        self.LOGGER.info("CMD: logout...")
+        try:
+            return await asyncio.wait_for(self._send_command(cmd), timeout)
+        finally:
+            await self.close()
+
+
+class AsyncClient(AsyncBaseClient):
+    """advanced class of asyncio client"""
+    def __init__(self, user: str, token: str, mode: str, url: str | None = None):
+        super().__init__(user, token, mode, url)
+        self.LOGGER = logging.getLogger('XTBApi.AsyncClient')
+        self.LOGGER.info("AsyncClient inited")
+
+    async def get_server_time(self):
+        """getServerTime command"""
+        cmd = _construct_cmd('getServerTime')
+        self.LOGGER.info("CMD: get server time...")
+        return await self._send_command(cmd)
+
+    async def get_chart_range_request(self, symbol: str, period: int, start: int, end: int, ticks: int):
+        """getChartRangeRequest command"""
+        cmd = _chart_range_cmd(symbol, period, start, end, ticks)
+        self.LOGGER.info(f"CMD: get chart range request for {symbol} of "
+                         f"{period} from {start} to {end} with ticks of "
+                         f"{ticks}...")
+        return await self._send_command(cmd)
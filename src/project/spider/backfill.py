@@ -0,0 +1,41 @@
+from datetime import datetime, date, time, timedelta, timezone
+
+from .bars import MINUTE_MS
+from .crud import _ct_max_backdate
+from .models import BackfillChunk
+from .schemas import CandleStatBase
+
+CHUNK_TICKS = 500
+
+
+def _day_ctm(day: date) -> int:
+    """Return: ctm (ms) of UTC midnight of day."""
+    return int(datetime.combine(day, time(0, 0), timezone.utc).timestamp()) * 1000
+
+
+def plan_chunks(ct: CandleStatBase, ticks: int = CHUNK_TICKS) -> list[tuple[int, int]]:
+    """Split the missing history before ct.date_from into (ctm_from, ctm_until) ranges
+    of `ticks` candles each, newest first."""
+    start = _day_ctm(_ct_max_backdate(ct.period))
+    end = _day_ctm(ct.date_from)
+    span = ticks * ct.period * MINUTE_MS
+    ranges = []
+    while end > start:
+        ranges.append((max(start, end - span), end))
+        end -= span
+    return ranges
+
+
+def contiguous_date_from(ct: CandleStatBase, chunks: list[BackfillChunk]) -> date:
+    """Return: earliest date reachable from ct.date_from through done chunks, without holes."""
+    anchor = _day_ctm(ct.date_from)
+    for chunk in sorted(chunks, key=lambda c: c.ctm_until, reverse=True):
+        if chunk.ctm_until < anchor:
+            break
+        if chunk.ctm_from >= anchor:
+            continue
+        if chunk.status != "done":
+            break
+        anchor = chunk.ctm_from
+    # only whole days count as stored
+    return (datetime.fromtimestamp((anchor - 1) / 1000, timezone.utc) + timedelta(days=1)).date()
@@ -0,0 +1,189 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from .columnar import Candles
+
+MINUTE_MS = 60_000
+HOUR_MS = 60 * MINUTE_MS
+# XTB server time; bars from H4 up open on its (DST-aware) boundaries,
+# shorter bars open on plain UTC boundaries.
+SERVER_TZ = ZoneInfo("Europe/Warsaw")
+SERVER_ALIGNED = 240
+
+
+def _server_offset(ctm: int) -> int:
+    """Return: server time UTC offset (ms) at ctm."""
+    return int(datetime.fromtimestamp(ctm / 1000, SERVER_TZ).utcoffset().total_seconds()) * 1000
+
+
+def bar_open(ctm: int, period: int) -> int:
+    """Return: open time (ms) of the `period` minutes bar containing ctm."""
+    step = period * MINUTE_MS
+    if period < SERVER_ALIGNED:
+        return ctm - ctm % step
+    wall = ctm + _server_offset(ctm)
+    return wall - wall % step - _server_offset(ctm)
+
+
+def next_bar_open(ctm: int, period: int) -> int:
+    """Return: open time (ms) of the bar after the `period` minutes bar containing ctm."""
+    # half a bar further always lands in the next bar, DST days included
+    return bar_open(bar_open(ctm, period) + period * MINUTE_MS * 3 // 2, period)
+
+
+def bar_opens(ctm: np.ndarray, period: int) -> np.ndarray:
+    """Return: open times (ms) of the `period` minutes bars containing each ctm."""
+    step = period * MINUTE_MS
+    if period < SERVER_ALIGNED:
+        return ctm - ctm % step
+    # offsets only change on the hour, look them up once per distinct hour
+    hours, inverse = np.unique(ctm // HOUR_MS, return_inverse=True)
+    offset = np.array([_server_offset(int(h) * HOUR_MS) for h in hours], np.int64)[inverse]
+    wall = ctm + offset
+    return wall - wall % step - offset
+
+
+def ctm_string(ctm: int) -> str:
+    """Return: ctmString of ctm, in server time, as XTB renders it: "Jan 10, 2014 3:04:00 PM"."""
+    t = datetime.fromtimestamp(ctm / 1000, SERVER_TZ)
+    return f"{t:%b} {t.day}, {t.year} {t.hour % 12 or 12}:{t:%M:%S %p}"
+
+
+def to_points(price: float, digits: int) -> int:
+    """Return: absolute price scaled to integer points."""
+    return round(price * 10 ** digits)
+
+
+class BarAggregator:
+    """Build `period` minutes bars out of streamed M1 candles.
+    Bars are kept in rateInfos form: open in points, close/high/low shifted by open.
+    The first bar is dropped unless its first minute was seen: the stream joined it
+    late, and a stored partial bar is never overwritten by the polling repair."""
+
+    def __init__(self, period: int, digits: int) -> None:
+        self.period = period
+        self.digits = digits
+        self._bar: dict | None = None
+        self._partial = False
+        self._started = False
+
+    def add(self, candle: dict) -> list[dict]:
+        """Add a streamed M1 candle of absolute prices. Return: bars closed by it."""
+        ctm = bar_open(int(candle['ctm']), self.period)
+        o, c, h, lo = (to_points(candle[k], self.digits) for k in ('open', 'close', 'high', 'low'))
+
+        closed = []
+        if self._bar is not None and self._bar['ctm'] != ctm:
+            closed.append(self._finish())
+        if self._bar is None:
+            self._partial = not self._started and int(candle['ctm']) != ctm
+            self._started = True
+            self._bar = {
+                'ctm': ctm, 'ctmString': candle.get('ctmString', ''),
+                'open': o, 'close': c, 'high': h, 'low': lo, 'vol': 0.0,
+            }
+        bar = self._bar
+        bar['close'] = c
+        bar['high'] = max(bar['high'], h)
+        bar['low'] = min(bar['low'], lo)
+        bar['vol'] += candle.get('vol', 0.0)
+        # the last minute of the bar closes it right away
+        if int(candle['ctm']) + MINUTE_MS >= ctm + self.period * MINUTE_MS:
+            closed.append(self._finish())
+        return [bar for bar in closed if bar is not None]
+
+    def _finish(self) -> dict | None:
+        """Return: current bar shifted relative to its open, None if partial, and reset."""
+        bar, self._bar = self._bar, None
+        if self._partial:
+            self._partial = False
+            return None
+        for k in ('close', 'high', 'low'):
+            bar[k] -= bar['open']
+        return bar
+
+
+def resample(
+        candles: Candles,
+        period_from: int,
+        period_to: int,
+        covered_from: int = 0,
+        closed_until: int = 0
+) -> Candles:
+    """Build `period_to` bars out of `period_from` candles, base candles being known
+    to be stored from `covered_from` up to `closed_until` when they are given.
+    A bar is emitted once a later candle shows the next bar has started, gaps
+    (breaks, market close) included. The first bar needs its first candle or to
+    open from `covered_from` on, the last bar needs the candles to cover it up to
+    its close or to close by `closed_until`."""
+    if not len(candles):
+        return Candles.empty()
+    order = np.argsort(candles.ctm, kind='stable')
+    ctm = candles.ctm[order]
+    o = candles.open[order]
+    c, h, lo = (o + getattr(candles, k)[order] for k in ('close', 'high', 'low'))
+
+    opens = bar_opens(ctm, period_to)
+    starts = np.flatnonzero(np.r_[True, opens[1:] != opens[:-1]])
+    ends = np.r_[starts[1:], len(ctm)] - 1
+    bucket = opens[starts]
+    # half a bar further always lands in the next bar, DST days included
+    next_open = bar_opens(bucket + period_to * MINUTE_MS * 3 // 2, period_to)
+
+    complete = np.ones(len(starts), bool)
+    # the first bar may have started before the candles do
+    complete[0] = ctm[0] == bucket[0] or 0 < covered_from <= bucket[0]
+    # the last bar may still be forming
+    complete[-1] &= ctm[-1] + period_from * MINUTE_MS >= next_open[-1] or next_open[-1] <= closed_until
+
+    b_open = o[starts]
+    derived = Candles(
+        bucket,
+        b_open,
+        c[ends] - b_open,
+        np.maximum.reduceat(h, starts) - b_open,
+        np.minimum.reduceat(lo, starts) - b_open,
+        np.add.reduceat(candles.vol[order], starts),
+    )
+    keep = np.flatnonzero(complete)
+    return Candles(*(getattr(derived, k)[keep] for k in ('ctm', 'open', 'close', 'high', 'low', 'vol')))
+
+
+def aggregation_base(pairs: tuple[tuple[str, int], ...], symbol: str, bucket: int) -> int | None:
+    """Return: coarsest configured period of symbol that divides `bucket` minutes
+    and opens on UTC boundaries, None if there is none."""
+    if bucket <= 0:
+        raise ValueError(f"invalid bucket {bucket}")
+    bases = [period for s, period in pairs if s == symbol and period < SERVER_ALIGNED and bucket % period == 0]
+    return max(bases, default=None)
+
+
+def derive_plan(pairs: tuple[tuple[str, int], ...], periods: tuple[int, ...]) -> dict[str, tuple[int, list[int]]]:
+    """Return: symbol -> (finest configured period, periods derived from it).
+    Derived periods are the configured and `periods` ones that the finest divides."""
+    plan = {}
+    for symbol in dict.fromkeys(symbol for symbol, _ in pairs):
+        configured = {period for s, period in pairs if s == symbol}
+        base = min(configured)
+        targets = sorted(p for p in configured | set(periods) if p > base and p % base == 0)
+        plan[symbol] = (base, targets)
+    return plan
+
+
+def compare_bars(derived: Candles, fetched: Candles) -> dict:
+    """Return: agreement report of derived bars against fetched ones, on common ctm."""
+    common, i, j = np.intersect1d(derived.ctm, fetched.ctm, return_indices=True)
+    report = {
+        "derived": len(derived),
+        "fetched": len(fetched),
+        "common": len(common),
+        "only_derived": len(derived) - len(common),
+        "only_fetched": len(fetched) - len(common),
+    }
+    for k in ('open', 'close', 'high', 'low', 'vol'):
+        diff = np.abs(getattr(derived, k)[i] - getattr(fetched, k)[j])
+        report[f"{k}_mismatch"] = int(np.count_nonzero(diff > 1e-9))
+        report[f"{k}_max_diff"] = float(diff.max()) if len(diff) else 0.0
+    return report
@@ -0,0 +1,94 @@
+import threading
+import time
+from typing import Any, Callable
+
+import orjson
+
+from ..database import redis_conn
+import logging
+LOGGER = logging.getLogger("Spider.Cache")
+LOGGER.setLevel(logging.INFO)
+
+# Responses are keyed by the version of their (symbol, timeframe), bumped by every write:
+# a write never deletes entries, it makes them unreachable until they expire.
+RESPONSE_TTL = 3600
+COALESCE_TIMEOUT = 10.0
+COALESCE_POLL = 0.02
+
+_inflight: dict[str, threading.Event] = {}
+_inflight_lock = threading.Lock()
+
+
+def _version_key(symbol_id: int, timeframe_id: int) -> str:
+    return f"xtb:ver:{symbol_id}:{timeframe_id}"
+
+
+def bump_version(symbol_id: int, timeframe_id: int):
+    """Invalidate cached responses of symbol & timeframe."""
+    redis_conn().incr(_version_key(symbol_id, timeframe_id))
+
+
+def data_version(symbol_id: int, timeframe_id: int) -> str:
+    return redis_conn().get(_version_key(symbol_id, timeframe_id)) or '0'
+
+
+def _fill(key: str, loader: Callable[[], Any], ttl: int) -> str:
+    body = orjson.dumps(loader()).decode()
+    redis_conn().set(key, body, ex=ttl)
+    return body
+
+
+def _await(key: str) -> str | None:
+    """Return: body of key once another process filled it, None on timeout."""
+    r = redis_conn()
+    deadline = time.monotonic() + COALESCE_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(COALESCE_POLL)
+        body = r.get(key)
+        if body is not None:
+            return body
+        if not r.exists(f"{key}:lock"):
+            break
+    return r.get(key)
+
+
+def cached_response(
+        name: str,
+        symbol_id: int,
+        timeframe_id: int,
+        params: tuple,
+        loader: Callable[[], Any],
+        ttl: int = RESPONSE_TTL
+) -> str:
+    """Read-through cache of JSON bodies. Identical concurrent misses run loader once:
+    threads of a process wait on an event, processes on a Redis lock.
+    Return: JSON body of loader's result."""
+    key = f"xtb:resp:{name}:{symbol_id}:{timeframe_id}:{data_version(symbol_id, timeframe_id)}:" \
+          + ':'.join(map(str, params))
+    r = redis_conn()
+    body = r.get(key)
+    if body is not None:
+        return body
+
+    with _inflight_lock:
+        event = _inflight.get(key)
+        leader = event is None
+        if leader:
+            event = _inflight[key] = threading.Event()
+    if not leader:
+        event.wait(COALESCE_TIMEOUT)
+        body = r.get(key)
+        return body if body is not None else _fill(key, loader, ttl)
+
+    try:
+        if r.set(f"{key}:lock", 1, nx=True, ex=int(COALESCE_TIMEOUT)):
+            try:
+                return _fill(key, loader, ttl)
+            finally:
+                r.delete(f"{key}:lock")
+        body = _await(key)
+        return body if body is not None else _fill(key, loader, ttl)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        event.set()
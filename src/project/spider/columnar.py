@@ -0,0 +1,103 @@
+from dataclasses import dataclass
+from operator import itemgetter
+
+import numpy as np
+
+PRICE_COLUMNS = ('open', 'close', 'high', 'low', 'vol')
+# stored as integer points, vol as double
+POINT_COLUMNS = ('open', 'close', 'high', 'low')
+
+
+@dataclass(slots=True)
+class Candles:
+    """Columnar candles in rateInfos form: open in points, close/high/low shifted by open.
+    ctmString is not kept, ctmstrings() renders it from ctm."""
+    ctm: np.ndarray
+    open: np.ndarray
+    close: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    vol: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ctm)
+
+    @classmethod
+    def empty(cls) -> 'Candles':
+        return cls(np.empty(0, np.int64), *(np.empty(0) for _ in PRICE_COLUMNS))
+
+    @classmethod
+    def from_rate_infos(cls, rate_infos: list[dict]) -> 'Candles':
+        """Return: columns of rateInfos."""
+        n = len(rate_infos)
+        if not n:
+            return cls.empty()
+        return cls(
+            np.fromiter(map(itemgetter('ctm'), rate_infos), np.int64, n),
+            *(np.fromiter(map(itemgetter(k), rate_infos), np.float64, n) for k in PRICE_COLUMNS),
+        )
+
+    @classmethod
+    def from_rows(cls, rows: list[tuple]) -> 'Candles':
+        """Return: columns of (ctm, open, close, high, low, vol) rows."""
+        if not rows:
+            return cls.empty()
+        ctm, *prices = zip(*rows)
+        return cls(
+            np.asarray(ctm, np.int64),
+            *(np.asarray(column, np.float64) for column in prices),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict[str, list]) -> 'Candles':
+        """Return: columns of a task payload made by to_dict."""
+        return cls(
+            np.asarray(data['ctm'], np.int64),
+            *(np.asarray(data[k], np.float64) for k in PRICE_COLUMNS),
+        )
+
+    def to_dict(self, ctmstring: bool = False) -> dict[str, list]:
+        """Return: column lists, as task payload."""
+        data = {'ctm': self.ctm.tolist()}
+        data.update({k: getattr(self, k).tolist() for k in PRICE_COLUMNS})
+        if ctmstring:
+            data['ctmString'] = self.ctmstrings()
+        return data
+
+    def ctmstrings(self) -> list[str]:
+        """Return: ctmString of every candle, in server time."""
+        from .bars import ctm_string
+        return [ctm_string(ctm) for ctm in self.ctm.tolist()]
+
+    def concat(self, other: 'Candles') -> 'Candles':
+        if not len(other):
+            return self
+        if not len(self):
+            return other
+        return Candles(
+            np.concatenate((self.ctm, other.ctm)),
+            *(np.concatenate((getattr(self, k), getattr(other, k))) for k in PRICE_COLUMNS),
+        )
+
+    def after(self, ctm: int) -> 'Candles':
+        """Return: candles opened after ctm."""
+        keep = self.ctm > ctm
+        if keep.all():
+            return self
+        return Candles(self.ctm[keep], *(getattr(self, k)[keep] for k in PRICE_COLUMNS))
+
+    def rows(self, symbol_id: int, timeframe_id: int) -> list[tuple]:
+        """Return: rows in candles table column order."""
+        n = len(self)
+        return list(zip(
+            [symbol_id] * n, [timeframe_id] * n,
+            self.ctm.tolist(),
+            *(np.rint(getattr(self, k)).astype(np.int64).tolist() for k in POINT_COLUMNS),
+            self.vol.tolist(),
+        ))
+
+
+def decode_chart(response: dict) -> tuple[Candles, int]:
+    """Return: columnar candles & digits of a getChartRangeRequest response."""
+    return_data = response.get('returnData') or {}
+    return Candles.from_rate_infos(return_data.get('rateInfos', [])), return_data.get('digits', 0)
@@ -1,16 +1,26 @@
+import asyncio
+import base64
+import binascii
+import csv
+import io
 from datetime import datetime, date, time, timedelta, timezone
-from typing import List, Iterable, Any
+from typing import List, Iterable, Iterator, Any
 
-from psycopg2 import OperationalError
 from psycopg2.extras import execute_values
 from pymongo import ReplaceOne
 from pymongo.database import Database
 from pymongo.errors import BulkWriteError
 
-from ..database import db_session, db_conn
-from .models import Candle, CandleStat
+from ..config import Config
+from ..database import db_session, db_conn, redis_conn
+from .cache import bump_version, cached_response
+from .partitions import ensure_partitions
+from .models import BackfillChunk
+from .bars import ctm_string, aggregation_base
+from .exchange import Exchange
+from .columnar import Candles, decode_chart
 from .schemas import CandleIn, CandleOut, CandleStatBase
-from .XTBApi import Client, CommandFailed, SocketError
+from .XTBApi import Client, AsyncClient, CommandFailed, SocketError
 import logging
 LOGGER = logging.getLogger("Spider.CRUD")
 LOGGER.setLevel(logging.INFO)
@@ -24,133 +34,542 @@ def error_message(message):
 # #
 # Postgres
 # #
+CANDLE_OUT = ('ctm', 'open', 'close', 'high', 'low', 'vol')
+
+
 def get_candles(symbol_id: int, timeframe_id: int, skip: int = 0, limit: int = 100):
-    """Query candles from DB. Return: List of Candle object."""
-    with db_session() as db:
-        candles = db.query(Candle).filter(
-            Candle.symbol_id == symbol_id,
-            Candle.timeframe_id == timeframe_id
-        ).offset(skip).limit(limit).all()
-    if not candles:
+    """Query candles from DB, oldest first. Return: List of Candle object."""
+    with db_conn() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT ctm, open, close, high, low, vol FROM candles
+                WHERE symbol_id = %s AND timeframe_id = %s
+                ORDER BY ctm OFFSET %s LIMIT %s;
+                """,
+                (symbol_id, timeframe_id, skip, limit))
+            rows = cursor.fetchall()
+    if not rows:
+        return None
+    return [CandleOut(**dict(zip(CANDLE_OUT, row)), ctmstring=ctm_string(row[0])) for row in rows]
+
+
+def encode_cursor(ctm: int) -> str:
+    return base64.urlsafe_b64encode(str(ctm).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    """Return: ctm of a cursor made by encode_cursor. Raise: ValueError if malformed."""
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"invalid cursor {cursor}") from e
+
+
+def query_candle_page(
+        symbol_id: int,
+        timeframe_id: int,
+        ctm_from: int,
+        ctm_until: int,
+        cursor: str | None = None,
+        limit: int = 1000
+) -> tuple[list[dict], str | None]:
+    """Query a page of candles of ctm_from <= ctm < ctm_until after cursor, by keyset on ctm.
+    Return: (candles as dicts, cursor of the next page or None when done)."""
+    if cursor:
+        ctm_from = max(ctm_from, decode_cursor(cursor) + 1)
+    with db_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT ctm, open, close, high, low, vol FROM candles
+                WHERE symbol_id = %s AND timeframe_id = %s AND ctm >= %s AND ctm < %s
+                ORDER BY ctm LIMIT %s;
+                """,
+                (symbol_id, timeframe_id, ctm_from, ctm_until, limit))
+            rows = cur.fetchall()
+    candles = [dict(zip(CANDLE_OUT, row), ctmstring=ctm_string(row[0])) for row in rows]
+    next_cursor = encode_cursor(rows[-1][0]) if len(rows) == limit else None
+    return candles, next_cursor
+
+
+def query_latest_candles(symbol_id: int, timeframe_id: int, limit: int) -> Candles:
+    """Query the latest stored candles, oldest first. Return: Candles."""
+    with db_conn() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT ctm, open, close, high, low, vol FROM candles
+                WHERE symbol_id = %s AND timeframe_id = %s
+                ORDER BY ctm DESC LIMIT %s;
+                """,
+                (symbol_id, timeframe_id, limit))
+            rows = cursor.fetchall()
+    return Candles.from_rows(rows[::-1])
+
+
+def query_candles(symbol_id: int, timeframe_id: int, ctm_from: int, ctm_until: int) -> Candles:
+    """Query stored candles of ctm_from <= ctm < ctm_until, oldest first. Return: Candles."""
+    with db_conn() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT ctm, open, close, high, low, vol FROM candles
+                WHERE symbol_id = %s AND timeframe_id = %s AND ctm >= %s AND ctm < %s
+                ORDER BY ctm;
+                """,
+                (symbol_id, timeframe_id, ctm_from, ctm_until))
+            rows = cursor.fetchall()
+    return Candles.from_rows(rows)
+
+
+def aggregate_candles(
+        symbol_id: int,
+        timeframe_id: int,
+        bucket: int,
+        ctm_from: int,
+        ctm_until: int
+) -> list[dict]:
+    """Roll stored candles up into `bucket` minutes OHLCV bars, in SQL, UTC aligned.
+    Return: bars in rateInfos form with their count of stored candles."""
+    bucket_ms = bucket * 60_000
+    with db_conn() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT ctm, open, close - open, high - open, low - open, vol, n FROM (
+                    SELECT ctm - ctm %% %(bucket)s AS ctm,
+                           (array_agg(open ORDER BY ctm))[1] AS open,
+                           (array_agg(open + close ORDER BY ctm DESC))[1] AS close,
+                           max(open + high) AS high,
+                           min(open + low) AS low,
+                           sum(vol) AS vol,
+                           count(*) AS n
+                    FROM candles
+                    WHERE symbol_id = %(sid)s AND timeframe_id = %(tid)s AND ctm >= %(from)s AND ctm < %(until)s
+                    GROUP BY 1
+                ) bars ORDER BY ctm;
+                """,
+                {'bucket': bucket_ms, 'sid': symbol_id, 'tid': timeframe_id, 'from': ctm_from, 'until': ctm_until})
+            rows = cursor.fetchall()
+    return [dict(zip(CANDLE_OUT + ('count',), row)) for row in rows]
+
+
+AGG_CACHE_TTL = 3600
+AGG_CACHE_TTL_OPEN = 30
+
+
+def rollup_candles(symbol_id: int, bucket: int, ctm_from: int, ctm_until: int) -> str | None:
+    """Aggregate `bucket` minutes bars of symbol out of the coarsest collected period that divides it,
+    window widened to whole buckets, cache first. Return: JSON of base period & bars, None if no base."""
+    if bucket <= 0:
+        raise ValueError(f"invalid bucket {bucket}")
+    symbol = next((s for s, sid in Exchange.SYMBOL_ID.items() if sid == symbol_id), None)
+    base = aggregation_base(Exchange.SYMBOL_DEFAULT + Exchange.SYMBOL_SUBSCRIBE, symbol, bucket)
+    if base is None:
         return None
-    return [CandleOut(**candle.__dict__) for candle in candles]
+    bucket_ms = bucket * 60_000
+    ctm_from -= ctm_from % bucket_ms
+    ctm_until += -ctm_until % bucket_ms
+    timeframe_id = Exchange.PERIOD_ID[base]
+    # windows still open get new candles every bar, keep them briefly
+    closed = ctm_until <= int(datetime.now(timezone.utc).timestamp() * 1000) - base * 60_000
+    return cached_response(
+        'agg', symbol_id, timeframe_id, (bucket, ctm_from, ctm_until),
+        lambda: {"base": base, "candles": aggregate_candles(symbol_id, timeframe_id, bucket, ctm_from, ctm_until)},
+        ttl=AGG_CACHE_TTL if closed else AGG_CACHE_TTL_OPEN,
+    )
+
+
+def stream_candles(
+        symbol_id: int,
+        timeframe_id: int,
+        ctm_from: int,
+        ctm_until: int,
+        batch: int = 50_000
+) -> Iterator[list[tuple]]:
+    """Stream (ctm, open, close, high, low, vol) rows of ctm_from <= ctm < ctm_until,
+    oldest first, `batch` rows at a time through a server-side cursor."""
+    with db_conn() as conn:
+        with conn.cursor(name=f"export_{symbol_id}_{timeframe_id}") as cursor:
+            cursor.itersize = batch
+            cursor.execute(
+                """
+                SELECT ctm, open, close, high, low, vol FROM candles
+                WHERE symbol_id = %s AND timeframe_id = %s AND ctm >= %s AND ctm < %s
+                ORDER BY ctm;
+                """,
+                (symbol_id, timeframe_id, ctm_from, ctm_until))
+            while rows := cursor.fetchmany(batch):
+                yield rows
+        conn.rollback()
 
 
-def upsert_preserve(table: str, data: List[tuple], page_size: int = 1000) -> int:
-    """PsycoPG2 batch upsert (on conflict id, do nothing). Return: number of inserted rows."""
+def upsert_preserve(table: str, data: List[tuple], page_size: int = 1000, conflict: str = 'id') -> int:
+    """PsycoPG2 batch upsert (on conflict, do nothing). Return: number of inserted rows."""
     with db_conn() as conn:
         with conn.cursor() as cursor:
             execute_values(
                 cursor,
                 f"""
-                INSERT INTO {table} VALUES %s ON CONFLICT (id) DO NOTHING; 
+                INSERT INTO {table} VALUES %s ON CONFLICT ({conflict}) DO NOTHING;
                 """,
                 data, page_size=page_size)
         conn.commit()
     return cursor.rowcount
 
 
+class _CsvStream(io.TextIOBase):
+    """Readable file of CSV lines rendered lazily from rows, for COPY FROM STDIN."""
+
+    def __init__(self, rows: Iterable[tuple], batch: int = 10_000) -> None:
+        self._rows = iter(rows)
+        self._batch = batch
+        self._buffer = ''
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self) -> bool:
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+        n = 0
+        for row in self._rows:
+            writer.writerow(row)
+            n += 1
+            if n >= self._batch:
+                break
+        self._buffer += out.getvalue()
+        return n > 0
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            if not self._fill():
+                break
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+COPY_MIN_ROWS = 500
+CANDLE_KEY = 'symbol_id, timeframe_id, ctm'
+CANDLE_COLUMNS = ('symbol_id', 'timeframe_id', 'ctm', 'open', 'close', 'high', 'low', 'vol')
+
+
+def copy_preserve(table: str, columns: tuple[str, ...], data: Iterable[tuple], conflict: str = 'id') -> tuple[int, int]:
+    """COPY rows into a temp staging table, then merge with a single
+    INSERT ... ON CONFLICT DO NOTHING. Return: (inserted, skipped) rows."""
+    cols = ', '.join(columns)
+    staging = f"staging_{table}"
+    with db_conn() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP;")
+            cursor.copy_expert(f"COPY {staging} ({cols}) FROM STDIN WITH (FORMAT csv);", _CsvStream(data))
+            copied = cursor.rowcount
+            cursor.execute(f"""
+                INSERT INTO {table} ({cols}) SELECT {cols} FROM {staging}
+                ON CONFLICT ({conflict}) DO NOTHING;
+                """)
+            inserted = cursor.rowcount
+        conn.commit()
+    LOGGER.info(f"{table}: copied={copied}, inserted={inserted}")
+    return inserted, copied - inserted
+
+
 def upsert_many_candles(candles: List[CandleIn]) -> int:
     """Upsert batch of candles. Return: number of inserted rows."""
+    if not candles:
+        return 0
+    ensure_partitions(min(c.ctm for c in candles), max(c.ctm for c in candles))
     data = [candle.as_tuple() for candle in candles]
-    return upsert_preserve(table='candles', data=data)
+    rowcount = upsert_preserve(table='candles', data=data, conflict=CANDLE_KEY)
+    for symbol_id, timeframe_id in {(c.symbol_id, c.timeframe_id) for c in candles}:
+        bump_version(symbol_id, timeframe_id)
+    return rowcount
+
+
+def upsert_candles(symbol_id: int, timeframe_id: int, candles: Candles) -> int:
+    """Upsert columnar candles, large batches through COPY. Return: number of inserted rows."""
+    if not len(candles):
+        return 0
+    if len(candles) >= COPY_MIN_ROWS:
+        inserted, _ = copy_candles(symbol_id, timeframe_id, candles)
+        return inserted
+    ensure_partitions(int(candles.ctm.min()), int(candles.ctm.max()))
+    rowcount = upsert_preserve(table='candles', data=candles.rows(symbol_id, timeframe_id), conflict=CANDLE_KEY)
+    bump_version(symbol_id, timeframe_id)
+    return rowcount
+
+
+def copy_candles(symbol_id: int, timeframe_id: int, candles: Candles) -> tuple[int, int]:
+    """Bulk insert columnar candles through COPY. Return: (inserted, skipped) rows."""
+    if not len(candles):
+        return 0, 0
+    ensure_partitions(int(candles.ctm.min()), int(candles.ctm.max()))
+    counts = copy_preserve('candles', CANDLE_COLUMNS, candles.rows(symbol_id, timeframe_id), conflict=CANDLE_KEY)
+    bump_version(symbol_id, timeframe_id)
+    return counts
+
+
+CT_COLUMNS = ('symbol_id', 'timeframe_id', 'symbol', 'period', 'date_from', 'date_until', 'digits', 'ctm_until')
+CT_CACHE_TTL = 3600
+
+
+def _ct_key(symbol_id: int, timeframe_id: int) -> str:
+    return f"xtb:ct:{symbol_id}:{timeframe_id}"
+
+
+def _cache_ct(ct: CandleStatBase) -> CandleStatBase:
+    redis_conn().set(_ct_key(ct.symbol_id, ct.timeframe_id), ct.model_dump_json(), ex=CT_CACHE_TTL)
+    return ct
+
+
+def _upsert_ct(ct: CandleStatBase, update: str) -> CandleStatBase:
+    """INSERT ... ON CONFLICT (symbol_id, timeframe_id) DO UPDATE SET update RETURNING the stored row."""
+    cols = ', '.join(CT_COLUMNS)
+    with db_conn() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO candles_stat ({cols}) VALUES %s
+                ON CONFLICT (symbol_id, timeframe_id) DO UPDATE SET {update}
+                RETURNING {cols};
+                """,
+                (tuple(getattr(ct, k) for k in CT_COLUMNS),))
+            row = cursor.fetchone()
+        conn.commit()
+    return _cache_ct(CandleStatBase(**dict(zip(CT_COLUMNS, row))))
 
 
 def query_ct(symbol_id: int, timeframe_id: int):
-    """Query candles stat by symbol & period. Return: CandleStat object."""
-    with db_session() as db:
-        ct = db.query(CandleStat).filter(
-            CandleStat.symbol_id == symbol_id,
-            CandleStat.timeframe_id == timeframe_id
-        ).first()
-    if not ct:
+    """Query candles stat by symbol & period, cache first. Return: CandleStat object."""
+    cached = redis_conn().get(_ct_key(symbol_id, timeframe_id))
+    if cached:
+        return CandleStatBase.model_validate_json(cached)
+    with db_conn() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {', '.join(CT_COLUMNS)} FROM candles_stat WHERE symbol_id = %s AND timeframe_id = %s;",
+                (symbol_id, timeframe_id))
+            row = cursor.fetchone()
+    if not row:
         return None
-    return CandleStatBase(**ct.__dict__)
+    return _cache_ct(CandleStatBase(**dict(zip(CT_COLUMNS, row))))
+
+
+def get_or_insert_ct(ct: CandleStatBase) -> CandleStatBase:
+    """Stored candles stat of ct's pair, ct itself inserted if missing. Return: CandleStat object."""
+    cached = redis_conn().get(_ct_key(ct.symbol_id, ct.timeframe_id))
+    if cached:
+        return CandleStatBase.model_validate_json(cached)
+    # no-op update, so that RETURNING yields the stored row too
+    return _upsert_ct(ct, "symbol = candles_stat.symbol")
 
 
 def insert_ct(ct: CandleStatBase):
-    """Insert candles stat. Return: CandleStat object."""
-    db_ct = CandleStat(**ct.dict())
-    with db_session() as db:
-        db.add(db_ct)
-        db.commit()
-        db.refresh(db_ct)
-    return ct
+    """Insert candles stat, keep the stored one. Return: CandleStat object."""
+    return get_or_insert_ct(ct)
+
+
+# the caller's copy may be stale: stored history & high-water marks only ever widen
+CT_UPDATE = ", ".join([
+    "symbol = EXCLUDED.symbol", "period = EXCLUDED.period", "digits = EXCLUDED.digits",
+    "date_from = LEAST(candles_stat.date_from, EXCLUDED.date_from)",
+    "date_until = GREATEST(candles_stat.date_until, EXCLUDED.date_until)",
+    "ctm_until = GREATEST(candles_stat.ctm_until, EXCLUDED.ctm_until)",
+])
 
 
 def update_ct(ct: CandleStatBase):
-    """Update candles stat. Return: CandleStat object."""
-    db_ct = CandleStat(**ct.dict())
-    with db_session() as db:
-        db.query(CandleStat).filter(
-            CandleStat.symbol_id == ct.symbol_id,
-            CandleStat.timeframe_id == ct.timeframe_id
-        ).update({
-            "date_from": db_ct.date_from,
-            "date_until": db_ct.date_until,
-            "digits": db_ct.digits,
-        })
-        db.commit()
+    """Upsert candles stat and refresh its cache. Return: CandleStat object."""
+    ct = _upsert_ct(ct, CT_UPDATE)
+    bump_version(ct.symbol_id, ct.timeframe_id)
     return ct
 
 
 def upsert_ct(ct: CandleStatBase):
     """Upsert candles stat. Return: CandleStat object."""
-    try:
-        update_ct(ct)
-    except OperationalError:
-        insert_ct(ct)
+    return update_ct(ct)
+
+
+def extend_ct_date_from(symbol_id: int, timeframe_id: int, date_from: date):
+    """Move candles stat date_from back, never forward."""
+    with db_conn() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "UPDATE candles_stat SET date_from = %s WHERE symbol_id = %s AND timeframe_id = %s AND date_from > %s;",
+                (date_from, symbol_id, timeframe_id, date_from))
+        conn.commit()
+    redis_conn().delete(_ct_key(symbol_id, timeframe_id))
+    bump_version(symbol_id, timeframe_id)
+
+
+def insert_backfill_chunks(symbol_id: int, timeframe_id: int, ranges: List[tuple[int, int]]) -> List[BackfillChunk]:
+    """Insert backfill chunks not planned yet. Return: List of chunks still to do."""
+    with db_session() as db:
+        known = {
+            chunk.ctm_from for chunk in db.query(BackfillChunk).filter(
+                BackfillChunk.symbol_id == symbol_id,
+                BackfillChunk.timeframe_id == timeframe_id,
+            ).all()
+        }
+        db.add_all([
+            BackfillChunk(symbol_id=symbol_id, timeframe_id=timeframe_id, ctm_from=ctm_from, ctm_until=ctm_until)
+            for ctm_from, ctm_until in ranges if ctm_from not in known
+        ])
+        db.commit()
+        chunks = db.query(BackfillChunk).filter(
+            BackfillChunk.symbol_id == symbol_id,
+            BackfillChunk.timeframe_id == timeframe_id,
+            BackfillChunk.status != "done",
+        ).order_by(BackfillChunk.ctm_from.desc()).all()
+        db.expunge_all()
+    return chunks
+
+
+def query_backfill_chunks(symbol_id: int, timeframe_id: int) -> List[BackfillChunk]:
+    """Query backfill chunks, newest first. Return: List of BackfillChunk object."""
+    with db_session() as db:
+        chunks = db.query(BackfillChunk).filter(
+            BackfillChunk.symbol_id == symbol_id,
+            BackfillChunk.timeframe_id == timeframe_id,
+        ).order_by(BackfillChunk.ctm_until.desc()).all()
+        db.expunge_all()
+    return chunks
+
+
+def finish_backfill_chunk(chunk_id: int, status: str, rowcount: int = 0):
+    """Record backfill chunk completion."""
+    with db_session() as db:
+        db.query(BackfillChunk).filter(BackfillChunk.id == chunk_id).update({
+            "status": status,
+            "rowcount": rowcount,
+            "updated": datetime.now(timezone.utc),
+        })
+        db.commit()
 
 
 # #
 # Exchange API
 # #
-def _get_chart_from_ts(
+PRESENT_TICKS = -300
+
+
+def _get_chart_range(
         client: Client,
-        ts:int,
+        start: int,
+        end: int,
         symbol: str,
         period: int,
         tick: int
-) -> tuple[list, int]:
+) -> tuple[Candles, int]:
     """getChartRangeRequest function with retry"""
-    default_result = ([], 0)
+    default_result = (Candles.empty(), 0)
     try:
-        res: dict = client.get_chart_range_request(symbol, period, ts, ts, tick)
+        res: dict = client.get_chart_range_request(symbol, period, start, end, tick)
         if not res.get('status', False):
             return default_result
     except (AttributeError, CommandFailed, SocketError) as err:
-        print(err)
-        res: dict = client.login()
+        LOGGER.error(err)
+        res: dict = client.reconnect()
         if not res.get('status', False):
             return default_result
-        res: dict = client.get_chart_range_request(symbol, period, ts, ts, tick)
+        res: dict = client.get_chart_range_request(symbol, period, start, end, tick)
         if not res.get('status', False):
             return default_result
 
-    return_data = res.get('returnData', {})
-    digits: int = return_data.get('digits', 0)
-    candles: list = return_data.get('rateInfos', [])
-    return candles, digits
+    return decode_chart(res)
 
 
-def gather_present_candles(ct: CandleStatBase, client: Client) -> tuple[list, int]:
+def _get_chart_from_ts(
+        client: Client,
+        ts: int,
+        symbol: str,
+        period: int,
+        tick: int
+) -> tuple[Candles, int]:
+    """getChartRangeRequest function by ticks from ts"""
+    return _get_chart_range(client, ts, ts, symbol, period, tick)
+
+
+def _present_range(ct: CandleStatBase, ts: int) -> tuple[int, int, int]:
+    """Return: (start, end, tick) of the missing present range.
+    Resume from the last stored candle, or a bounded window when it is unknown."""
+    if ct.ctm_until:
+        return ct.ctm_until // 1000, ts, 0
+    return ts, ts, PRESENT_TICKS
+
+
+def gather_present_candles(ct: CandleStatBase, client: Client) -> tuple[Candles, int]:
     """get present charts"""
     ts = int(datetime.now(timezone.utc).timestamp())
-    return _get_chart_from_ts(client, ts, ct.symbol, ct.period, tick=-300)
+    start, end, tick = _present_range(ct, ts)
+    return _get_chart_range(client, start, end, ct.symbol, ct.period, tick)
+
+
+def gather_present_candles_many(cts: List[CandleStatBase], client: Client) -> list[tuple[Candles, int]]:
+    """get present charts of many symbols & periods, pipelined on one client"""
+    ts = int(datetime.now(timezone.utc).timestamp())
+    default_result = (Candles.empty(), 0)
+    try:
+        responses = client.get_chart_range_requests(
+            [(ct.symbol, ct.period, *_present_range(ct, ts)) for ct in cts]
+        )
+    except (AttributeError, CommandFailed, SocketError) as err:
+        LOGGER.error(err)
+        return [default_result for _ in cts]
+
+    return [
+        decode_chart(res) if res.get('status', False) else default_result
+        for res in responses
+    ]
+
+
+async def _async_get_chart_range(
+        client: AsyncClient,
+        start: int,
+        end: int,
+        symbol: str,
+        period: int,
+        tick: int
+) -> tuple[Candles, int]:
+    """getChartRangeRequest coroutine"""
+    default_result = (Candles.empty(), 0)
+    try:
+        res: dict = await client.get_chart_range_request(symbol, period, start, end, tick)
+    except (CommandFailed, SocketError) as err:
+        LOGGER.error(err)
+        return default_result
+
+    return decode_chart(res)
+
+
+async def async_gather_present_candles(cts: List[CandleStatBase], client: AsyncClient) -> list[tuple[Candles, int]]:
+    """get present charts of many symbols & periods concurrently"""
+    ts = int(datetime.now(timezone.utc).timestamp())
+    ranges = [_present_range(ct, ts) for ct in cts]
+    return await asyncio.gather(*[
+        _async_get_chart_range(client, start, end, ct.symbol, ct.period, tick)
+        for ct, (start, end, tick) in zip(cts, ranges)
+    ])
 
 
 def _ct_max_backdate(timeframe) -> date:
     """Return suitable date to look back"""
     today_utc = datetime.now(timezone.utc).date()
     m = today_utc - timedelta(days=12*timeframe)
+    if Config.PGSQL_RETENTION_YEARS > 0:
+        # partitions older than retention get dropped, do not fetch them again
+        m = max(m, date(today_utc.year - Config.PGSQL_RETENTION_YEARS, 1, 1))
     if timeframe == 30:
         return max(m, date(2023, 7, 21))
     return m
 
 
-def gather_olden_candles(ct: CandleStatBase, client: Client) -> tuple[list, int]:
+def gather_olden_candles(ct: CandleStatBase, client: Client) -> tuple[Candles, int]:
     """get olden charts"""
-    default_result = ([], 0)
+    default_result = (Candles.empty(), 0)
     if _ct_max_backdate(ct.period) >= ct.date_from:
         return default_result
     ts = int(datetime.combine(ct.date_from, time(0, 0)).timestamp())
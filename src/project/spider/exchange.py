@@ -2,6 +2,48 @@ import json
 from pathlib import Path
 from pydantic.dataclasses import dataclass
 
+from ..config import Config
+import logging
+LOGGER = logging.getLogger("Spider.Exchange")
+LOGGER.setLevel(logging.INFO)
+
+
+def account_file() -> Path:
+    """Return: path of the XTB accounts file, Config.XTB_ACCOUNT_FILE or account.json of this package."""
+    return Path(Config.XTB_ACCOUNT_FILE) if Config.XTB_ACCOUNT_FILE else Path(__file__).with_name('account.json')
+
+
+class _AccountFile:
+    """XTB accounts of account_file(), read on first access and cached."""
+
+    def __init__(self) -> None:
+        self._accounts: dict | None = None
+
+    def __get__(self, obj, owner) -> dict:
+        if self._accounts is None:
+            path = account_file()
+            if path.is_file():
+                self._accounts = json.loads(path.read_text())
+            else:
+                LOGGER.warning(f"account file {path} not found, no XTB accounts")
+                self._accounts = {}
+        return self._accounts
+
+
+def account(user: str) -> dict:
+    """Return: XTB account of user, raise LookupError if it is not in the accounts file."""
+    accounts = Exchange.ACCOUNTS
+    if user not in accounts:
+        raise LookupError(f"XTB account {user!r} not in {account_file()}, set WORKER_ID or XTB_ACCOUNT_FILE")
+    return accounts[user]
+
+
+def pool_accounts() -> dict[str, dict]:
+    """Return: XTB accounts of the session pool, raise LookupError if there are none."""
+    if not Exchange.ACCOUNTS:
+        raise LookupError(f"XTB_POOL is set but {account_file()} holds no accounts")
+    return Exchange.ACCOUNTS
+
 
 @dataclass
 class Exchange:
@@ -15,15 +57,16 @@ class Exchange:
     SYMBOL_SUBSCRIBE = (
         ('GOLD', 240),
     )
+    SYMBOL_WEEKEND = ('BITCOIN',)
     SYMBOL_ID = {'GOLD': 1,
                  'GOLD.FUT': 2,
                  'BITCOIN': 3,
                  'EURUSD': 4,
                  'OIL.WTI': 5,
                  'USDJPY': 6}
+    RESAMPLE_PERIODS = (15, 30, 60, 240, 1440)
     PERIOD_ID = {1: 0, 5: 1, 15: 2, 30: 3, 60: 4, 240: 5, 1440: 6, 10080: 7, 43200: 8}
-    _account_file = next(Path.cwd().glob("**/account.json"))
-    ACCOUNTS = json.load(open(_account_file)) if _account_file.is_file() else {}
+    ACCOUNTS = _AccountFile()
     PRESETS = {
         "TA_RSI_L14_XA70_XB30": [{
                 "kind": "rsi", "length": 14, "signal_indicators": True,
@@ -0,0 +1,71 @@
+import io
+from typing import Iterator
+
+import orjson
+
+from .crud import CANDLE_OUT
+
+# format -> media type of the streamed body
+MEDIA_TYPES = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def encode_ndjson(batches: Iterator[list[tuple]]) -> Iterator[bytes]:
+    """Return: one JSON object per candle and line, a chunk per batch."""
+    for rows in batches:
+        yield b''.join(orjson.dumps(dict(zip(CANDLE_OUT, row))) + b'\n' for row in rows)
+
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('ctm', pa.int64()), ('open', pa.int32()), ('close', pa.int32()),
+        ('high', pa.int32()), ('low', pa.int32()), ('vol', pa.float64()),
+    ])
+
+
+def _record_batch(rows: list[tuple], schema):
+    import pyarrow as pa
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+    )
+
+
+def _drain(buffer: io.BytesIO) -> bytes:
+    """Return: bytes written to buffer so far, and empty it."""
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def encode_arrow(batches: Iterator[list[tuple]]) -> Iterator[bytes]:
+    """Return: Arrow IPC stream, a record batch per batch."""
+    import pyarrow as pa
+    schema = _schema()
+    buffer = io.BytesIO()
+    with pa.ipc.new_stream(buffer, schema) as writer:
+        for rows in batches:
+            writer.write_batch(_record_batch(rows, schema))
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def encode_parquet(batches: Iterator[list[tuple]]) -> Iterator[bytes]:
+    """Return: Parquet file, a row group per batch, footer last."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = _schema()
+    buffer = io.BytesIO()
+    with pq.ParquetWriter(buffer, schema, compression='zstd') as writer:
+        for rows in batches:
+            writer.write_table(pa.Table.from_batches([_record_batch(rows, schema)]))
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+ENCODERS = {'arrow': encode_arrow, 'parquet': encode_parquet, 'ndjson': encode_ndjson}
@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from datetime import datetime
+
+from websockets.asyncio.server import ServerConnection, serve
+from websockets.exceptions import ConnectionClosed
+
+from .bars import bar_open, SERVER_TZ
+import logging
+LOGGER = logging.getLogger("Spider.FakeXTB")
+LOGGER.setLevel(logging.INFO)
+
+MINUTE_MS = 60_000
+DIGITS = {'GOLD': 2, 'GOLD.FUT': 2, 'BITCOIN': 2, 'EURUSD': 5, 'OIL.WTI': 2, 'USDJPY': 3}
+MAX_CANDLES = 5000
+
+
+def xtb_time_string(ms: int) -> str:
+    """Return: time string as XTB sends it, Java medium format in server time: "Jan 10, 2014 3:04:00 PM".
+    Rendered apart from bars.ctm_string, so that the client's rendering is checked against it."""
+    return datetime.fromtimestamp(ms / 1000, SERVER_TZ).strftime("%b %-d, %Y %-I:%M:%S %p")
+
+
+def synthetic_candle(symbol: str, period: int, ctm: int) -> dict:
+    """Return: deterministic candle of symbol & period opening at ctm, in rateInfos form."""
+    rnd = random.Random(f"{symbol}/{period}/{ctm}")
+    digits = DIGITS.get(symbol, 2)
+    base = 2000 * 10 ** digits if digits <= 2 else 150 * 10 ** digits
+    drift = (ctm // (period * MINUTE_MS)) % 1000 - 500
+    open_ = base + drift * 10 + rnd.randint(-50, 50)
+    close = rnd.randint(-100, 100)
+    return {
+        'ctm': ctm,
+        'ctmString': xtb_time_string(ctm),
+        'open': float(open_),
+        'close': float(close),
+        'high': float(max(0, close) + rnd.randint(0, 50)),
+        'low': float(min(0, close) - rnd.randint(0, 50)),
+        'vol': float(rnd.randint(0, 5000)),
+    }
+
+
+def _bar_opens(first: int, period: int, n: int) -> list[int]:
+    """Return: opens of n consecutive bars from the one containing first."""
+    opens = [bar_open(first, period)]
+    while len(opens) < n:
+        opens.append(bar_open(opens[-1] + period * MINUTE_MS * 3 // 2, period))
+    return opens
+
+
+def synthetic_chart(symbol: str, period: int, start: int, end: int, ticks: int) -> list[dict]:
+    """Return: rateInfos of getChartRangeRequest, ticks count from start when not zero."""
+    step = period * MINUTE_MS
+    if ticks < 0:
+        n = min(-ticks, MAX_CANDLES)
+        opens = _bar_opens(start - (n - 1) * step, period, n)
+    elif ticks > 0:
+        opens = _bar_opens(start + step, period, min(ticks, MAX_CANDLES))
+    else:
+        opens = [ctm for ctm in _bar_opens(start, period, min((end - start) // step + 2, MAX_CANDLES))
+                 if start <= ctm <= end]
+    return [synthetic_candle(symbol, period, ctm) for ctm in opens]
+
+
+class FakeXTBServer:
+    """Local stand-in of the XTB WebSocket API: login (an empty userId is refused), logout,
+    ping, getServerTime, getSymbol and getChartRangeRequest with synthetic rateInfos.
+    Responses are delayed by `latency` (+ `jitter`) seconds, a share of `error_rate`
+    commands fail and a share of `drop_rate` commands close the socket."""
+
+    def __init__(
+            self,
+            host: str = 'localhost',
+            port: int = 0,
+            latency: float = 0.05,
+            jitter: float = 0.0,
+            error_rate: float = 0.0,
+            drop_rate: float = 0.0,
+            seed: int = 0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self._rnd = random.Random(seed)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopped: asyncio.Event | None = None
+        self._thread: threading.Thread | None = None
+        self._ready = threading.Event()
+        self.commands = 0
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    def _dispatch(self, data: dict) -> dict:
+        """Return: response of one command."""
+        command = data.get('command')
+        args = data.get('arguments', {})
+        if command == 'login':
+            if not args.get('userId'):
+                return {'status': False, 'errorCode': 'BE005', 'errorDescr': 'userId or password invalid'}
+            return {'status': True, 'streamSessionId': f"fake-{args.get('userId', '')}"}
+        if command in ('logout', 'ping'):
+            return {'status': True}
+        if command == 'getServerTime':
+            ms = int(time.time() * 1000)
+            return {'status': True, 'returnData': {'time': ms, 'timeString': xtb_time_string(ms)}}
+        if command == 'getSymbol':
+            symbol = args.get('symbol', '')
+            return {'status': True, 'returnData': {'symbol': symbol, 'precision': DIGITS.get(symbol, 2)}}
+        if command == 'getChartRangeRequest':
+            info = args.get('info', {})
+            symbol = info.get('symbol', '')
+            rate_infos = synthetic_chart(
+                symbol, info.get('period', 1), info.get('start', 0), info.get('end', 0), info.get('ticks', 0)
+            )
+            return {'status': True, 'returnData': {'digits': DIGITS.get(symbol, 2), 'rateInfos': rate_infos}}
+        return {'status': False, 'errorCode': 'EX007', 'errorDescr': f"Unknown command {command}"}
+
+    async def _respond(self, ws: ServerConnection, message: str):
+        data = json.loads(message)
+        self.commands += 1
+        await asyncio.sleep(self.latency + self._rnd.uniform(0, self.jitter))
+        if self._rnd.random() < self.drop_rate:
+            await ws.close()
+            return
+        if self._rnd.random() < self.error_rate:
+            res = {'status': False, 'errorCode': 'EX001', 'errorDescr': 'Injected error'}
+        else:
+            res = self._dispatch(data)
+        if 'customTag' in data:
+            res['customTag'] = data['customTag']
+        try:
+            await ws.send(json.dumps(res))
+        except ConnectionClosed:
+            pass
+
+    async def _handler(self, ws: ServerConnection):
+        tasks = set()
+        try:
+            async for message in ws:
+                t = asyncio.create_task(self._respond(ws, message))
+                tasks.add(t)
+                t.add_done_callback(tasks.discard)
+        except ConnectionClosed:
+            pass
+
+    async def serve_forever(self):
+        self._stopped = asyncio.Event()
+        async with serve(self._handler, self.host, self.port) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            LOGGER.info(f"FakeXTB: listening on {self.url}")
+            self._ready.set()
+            await self._stopped.wait()
+
+    def start(self) -> 'FakeXTBServer':
+        """Serve in a background thread. Return: self, once listening."""
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.serve_forever())
+        self._thread = threading.Thread(target=run, name="FakeXTB", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        """Stop serving and join the background thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+            self._thread.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in of the XTB WebSocket API")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakeXTBServer(
+        args.host, args.port, args.latency, args.jitter, args.error_rate, args.drop_rate
+    )
+    asyncio.run(fake.serve_forever())
@@ -0,0 +1,25 @@
+from typing import Any
+
+
+class Indicators:
+    """Indicators of TA presets over one candle frame, computed by pandas_ta itself.
+    Entries repeated across presets are computed once.
+    Columns & values are those `df.ta.strategy` would append."""
+
+    def __init__(self, df) -> None:
+        self.df = df
+        self._memo: dict[str, Any] = {}
+
+    def indicator(self, params: dict):
+        """Return: Series or DataFrame of one `Strategy.ta` entry."""
+        key = repr(sorted(params.items()))
+        if key not in self._memo:
+            options = {k: v for k, v in params.items() if k != 'kind'}
+            self._memo[key] = getattr(self.df.ta, params['kind'])(**options)
+        return self._memo[key]
+
+    def preset(self, ta: list[dict]):
+        """Return: ctm & indicator columns of one preset, rows where any is missing dropped."""
+        from pandas import concat
+        out = concat([self.df[['ctm']]] + [self.indicator(params) for params in ta], axis=1)
+        return out.dropna(ignore_index=True)
@@ -0,0 +1,75 @@
+import argparse
+import csv
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+
+from .columnar import Candles, PRICE_COLUMNS
+from .crud import copy_candles, extend_ct_date_from
+from .exchange import Exchange
+import logging
+LOGGER = logging.getLogger("Spider.Ingest")
+LOGGER.setLevel(logging.INFO)
+
+BATCH_ROWS = 200_000
+
+
+def _csv_batches(path: Path, size: int) -> Iterator[Candles]:
+    """Return: candles of a csv file with ctm, [ctmString,] open, close, high, low, vol header."""
+    with open(path, newline='') as f:
+        batch = []
+        for row in csv.DictReader(f):
+            row['ctm'] = int(row['ctm'])
+            for k in PRICE_COLUMNS:
+                row[k] = float(row[k])
+            batch.append(row)
+            if len(batch) >= size:
+                yield Candles.from_rate_infos(batch)
+                batch = []
+        if batch:
+            yield Candles.from_rate_infos(batch)
+
+
+def _parquet_batches(path: Path, size: int) -> Iterator[Candles]:
+    """Return: candles of a parquet file with the csv columns, read batch by batch."""
+    import numpy as np
+    import pyarrow.parquet as pq
+    columns = ('ctm',) + PRICE_COLUMNS
+    for record_batch in pq.ParquetFile(path).iter_batches(batch_size=size, columns=list(columns)):
+        yield Candles(*(
+            np.asarray(record_batch.column(k).to_numpy(zero_copy_only=False), np.int64 if k == 'ctm' else np.float64)
+            for k in columns
+        ))
+
+
+def ingest_file(path: Path, symbol: str, period: int, size: int = BATCH_ROWS) -> tuple[int, int]:
+    """COPY candles of a csv or parquet file into candles of symbol & period.
+    Return: (inserted, skipped) rows."""
+    symbol_id, period_id = Exchange.SYMBOL_ID[symbol], Exchange.PERIOD_ID[period]
+    batches = _parquet_batches(path, size) if path.suffix == '.parquet' else _csv_batches(path, size)
+    inserted = skipped = 0
+    ctm_first = None
+    for candles in batches:
+        if not len(candles):
+            continue
+        i, s = copy_candles(symbol_id, period_id, candles)
+        inserted, skipped = inserted + i, skipped + s
+        first = int(candles.ctm.min())
+        ctm_first = first if ctm_first is None else min(ctm_first, first)
+        LOGGER.info(f"{symbol}_{period}: inserted={inserted}, skipped={skipped}")
+
+    if ctm_first is not None:
+        # imports are history: only widen date_from, present fetches keep ctm_until
+        extend_ct_date_from(symbol_id, period_id, datetime.fromtimestamp(ctm_first / 1000, timezone.utc).date())
+    return inserted, skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk import candles from a csv or parquet file")
+    parser.add_argument('file', type=Path)
+    parser.add_argument('--symbol', required=True, choices=list(Exchange.SYMBOL_ID))
+    parser.add_argument('--period', required=True, type=int, choices=list(Exchange.PERIOD_ID))
+    parser.add_argument('--batch', type=int, default=BATCH_ROWS)
+    args = parser.parse_args()
+    inserted, skipped = ingest_file(args.file, args.symbol, args.period, args.batch)
+    print(f"inserted={inserted} skipped={skipped}")
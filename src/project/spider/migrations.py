@@ -0,0 +1,49 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from .partitions import partition_candles
+import logging
+LOGGER = logging.getLogger("Spider.Migrations")
+LOGGER.setLevel(logging.INFO)
+
+# Idempotent DDL for tables created before a column/constraint was added.
+# create_all only creates missing tables, it never alters existing ones.
+MIGRATIONS = [
+    "ALTER TABLE candles_stat ADD COLUMN IF NOT EXISTS ctm_until BIGINT",
+    # one stat per pair, so that it can be upserted
+    """
+    DELETE FROM candles_stat a USING candles_stat b
+    WHERE a.symbol_id = b.symbol_id AND a.timeframe_id = b.timeframe_id AND a.id > b.id
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS candles_stat_symbol_id_timeframe_id_key ON candles_stat (symbol_id, timeframe_id)",
+]
+
+
+def compact_candles(conn: Connection):
+    """Convert Numeric candle prices to integer points and drop the stored ctmstring."""
+    data_type = conn.execute(text(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = 'candles' AND column_name = 'open'"
+    )).scalar()
+    if data_type != 'numeric':
+        return
+    LOGGER.info("compacting candles")
+    conn.execute(text(
+        """
+        ALTER TABLE candles
+            DROP COLUMN IF EXISTS ctmstring,
+            ALTER COLUMN open TYPE INTEGER USING round(open),
+            ALTER COLUMN close TYPE INTEGER USING round(close),
+            ALTER COLUMN high TYPE INTEGER USING round(high),
+            ALTER COLUMN low TYPE INTEGER USING round(low),
+            ALTER COLUMN vol TYPE DOUBLE PRECISION
+        """))
+
+
+def apply_migrations(engine: Engine):
+    """Apply every migration in one transaction."""
+    with engine.begin() as conn:
+        for statement in MIGRATIONS:
+            conn.execute(text(statement))
+        partition_candles(conn)
+        compact_candles(conn)
+    LOGGER.info(f"applied {len(MIGRATIONS)} migrations")
@@ -1,23 +1,25 @@
 from ..database import Base
-from sqlalchemy import Column, String, Integer, BigInteger, Numeric, Date
+from sqlalchemy import Column, String, Integer, BigInteger, Float, Date, DateTime, UniqueConstraint
 
 
 class Candle(Base):
     __tablename__ = "candles"
-    id = Column("id", BigInteger, primary_key=True)
-    symbol_id = Column("symbol_id", Integer, index=True)
-    timeframe_id = Column("timeframe_id", Integer, index=True)
-    ctm = Column("ctm", BigInteger)
-    ctmstring = Column("ctmstring", String)
-    open = Column("open", Numeric)
-    close = Column("close", Numeric)
-    high = Column("high", Numeric)
-    low = Column("low", Numeric)
-    vol = Column("vol", Numeric)
+    # range reads of one (symbol, timeframe) walk the primary key of yearly ctm partitions
+    __table_args__ = {"postgresql_partition_by": "RANGE (ctm)"}
+    symbol_id = Column("symbol_id", Integer, primary_key=True)
+    timeframe_id = Column("timeframe_id", Integer, primary_key=True)
+    ctm = Column("ctm", BigInteger, primary_key=True)
+    # prices in points (x 10^digits of candles_stat), close/high/low relative to open
+    open = Column("open", Integer)
+    close = Column("close", Integer)
+    high = Column("high", Integer)
+    low = Column("low", Integer)
+    vol = Column("vol", Float)
 
 
 class CandleStat(Base):
     __tablename__ = "candles_stat"
+    __table_args__ = (UniqueConstraint("symbol_id", "timeframe_id"),)
     id = Column("id", Integer, primary_key=True, autoincrement=True)
     symbol_id = Column("symbol_id", Integer)
     timeframe_id = Column("timeframe_id", Integer)
@@ -26,3 +28,17 @@ class CandleStat(Base):
     date_from = Column("date_from", Date)
     date_until = Column("date_until", Date)
     digits = Column("digits", Integer)
+    ctm_until = Column("ctm_until", BigInteger, nullable=True)
+
+
+class BackfillChunk(Base):
+    __tablename__ = "candles_backfill"
+    __table_args__ = (UniqueConstraint("symbol_id", "timeframe_id", "ctm_from"),)
+    id = Column("id", Integer, primary_key=True, autoincrement=True)
+    symbol_id = Column("symbol_id", Integer)
+    timeframe_id = Column("timeframe_id", Integer)
+    ctm_from = Column("ctm_from", BigInteger)
+    ctm_until = Column("ctm_until", BigInteger)
+    status = Column("status", String, default="pending")
+    rowcount = Column("rowcount", Integer, default=0)
+    updated = Column("updated", DateTime(timezone=True))
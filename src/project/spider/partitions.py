@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+
+from psycopg2 import errors
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from ..database import db_conn
+from .models import Candle
+import logging
+LOGGER = logging.getLogger("Spider.Partitions")
+LOGGER.setLevel(logging.INFO)
+
+# candles is range partitioned by ctm, one partition per UTC year:
+# daily history reaches decades back while M5 keeps only weeks.
+PARTITION_PREFIX = "candles_y"
+_partitions: set[int] = set()
+
+
+def _year_ctm(year: int) -> int:
+    """Return: ctm (ms) of UTC new year of year."""
+    return int(datetime(year, 1, 1, tzinfo=timezone.utc).timestamp()) * 1000
+
+
+def _ctm_year(ctm: int) -> int:
+    return datetime.fromtimestamp(ctm / 1000, timezone.utc).year
+
+
+def _create_sql(year: int) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {PARTITION_PREFIX}{year} PARTITION OF candles "
+        f"FOR VALUES FROM ({_year_ctm(year)}) TO ({_year_ctm(year + 1)})"
+    )
+
+
+def ensure_partitions(ctm_from: int, ctm_until: int):
+    """Create missing partitions covering ctm_from..ctm_until (ms), once per process."""
+    years = [y for y in range(_ctm_year(ctm_from), _ctm_year(ctm_until) + 1) if y not in _partitions]
+    if not years:
+        return
+    with db_conn() as conn:
+        for year in years:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(_create_sql(year))
+                conn.commit()
+            except (errors.DuplicateTable, errors.UniqueViolation):
+                # another worker created it in between
+                conn.rollback()
+            _partitions.add(year)
+
+
+def list_partitions() -> list[int]:
+    """Return: years of existing candles partitions, ascending."""
+    with db_conn() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = 'candles';
+                """)
+            names = [row[0] for row in cursor.fetchall()]
+    return sorted(int(n[len(PARTITION_PREFIX):]) for n in names if n.startswith(PARTITION_PREFIX))
+
+
+def drop_expired_partitions(keep_years: int) -> list[int]:
+    """Drop partitions entirely older than keep_years before the current year. Return: dropped years."""
+    if keep_years <= 0:
+        return []
+    cutoff = datetime.now(timezone.utc).year - keep_years
+    expired = [year for year in list_partitions() if year < cutoff]
+    with db_conn() as conn:
+        with conn.cursor() as cursor:
+            for year in expired:
+                cursor.execute(f"DROP TABLE IF EXISTS {PARTITION_PREFIX}{year}")
+                _partitions.discard(year)
+        conn.commit()
+    if expired:
+        LOGGER.info(f"dropped candles partitions {expired}")
+    return expired
+
+
+def partition_candles(conn: Connection):
+    """Migrate an unpartitioned candles table (synthetic id key) to the partitioned layout."""
+    relkind = conn.execute(text("SELECT relkind FROM pg_class WHERE relname = 'candles'")).scalar()
+    if relkind != 'r':
+        return
+    LOGGER.info("partitioning candles")
+    conn.execute(text("ALTER TABLE candles RENAME TO candles_unpartitioned"))
+    conn.execute(text("ALTER TABLE candles_unpartitioned RENAME CONSTRAINT candles_pkey TO candles_unpartitioned_pkey"))
+    for index in ("ix_candles_symbol_id", "ix_candles_timeframe_id"):
+        conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+    Candle.__table__.create(conn)
+    ctm_min, ctm_max = conn.execute(text("SELECT min(ctm), max(ctm) FROM candles_unpartitioned")).one()
+    if ctm_min is not None:
+        for year in range(_ctm_year(ctm_min), _ctm_year(ctm_max) + 1):
+            conn.execute(text(_create_sql(year)))
+    columns = ', '.join(c.name for c in Candle.__table__.columns)
+    conn.execute(text(
+        f"INSERT INTO candles ({columns}) SELECT {columns} FROM candles_unpartitioned "
+        f"ON CONFLICT (symbol_id, timeframe_id, ctm) DO NOTHING"
+    ))
+    conn.execute(text("DROP TABLE candles_unpartitioned"))
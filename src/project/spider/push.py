@@ -0,0 +1,118 @@
+import asyncio
+
+import orjson
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from ..config import Config
+from ..database import redis_conn
+from .columnar import Candles
+import logging
+LOGGER = logging.getLogger("Spider.Push")
+LOGGER.setLevel(logging.INFO)
+
+# xtb:push:candles:{symbol_id}:{timeframe_id} & xtb:push:ta:{symbol_id}:{timeframe_id}:{strategy}
+PREFIX = "xtb:push:"
+QUEUE_SIZE = 256
+RECONNECT_DELAY = 1.0
+
+
+def publish_candles(symbol_id: int, timeframe_id: int, candles: Candles, digits: int):
+    """Publish newly stored candles, columnar."""
+    if not len(candles):
+        return
+    message = {"type": "candles", "symbol_id": symbol_id, "timeframe_id": timeframe_id, "digits": digits}
+    message.update(candles.to_dict())
+    redis_conn().publish(f"{PREFIX}candles:{symbol_id}:{timeframe_id}", orjson.dumps(message))
+
+
+def publish_ta(strategy: str, symbol_id: int, timeframe_id: int, ctm: int, values: dict[str, float]):
+    """Publish the latest TA values of strategy."""
+    message = {
+        "type": "ta", "strategy": strategy, "symbol_id": symbol_id, "timeframe_id": timeframe_id,
+        "ctm": ctm, "values": values,
+    }
+    redis_conn().publish(f"{PREFIX}ta:{symbol_id}:{timeframe_id}:{strategy}", orjson.dumps(message))
+
+
+class Subscriber:
+    """Bounded queue of one client's messages. When the client lags behind,
+    the oldest messages are dropped instead of stalling the fan-out."""
+
+    def __init__(
+            self,
+            kind: str | None = None,
+            symbol_id: int | None = None,
+            timeframe_id: int | None = None,
+            strategy: str | None = None,
+            size: int = QUEUE_SIZE
+    ) -> None:
+        self.kind = kind
+        self.symbol_id = symbol_id
+        self.timeframe_id = timeframe_id
+        self.strategy = strategy
+        self.queue: asyncio.Queue[bytes] = asyncio.Queue(size)
+        self.dropped = 0
+
+    def matches(self, channel: str) -> bool:
+        kind, symbol_id, timeframe_id, *strategy = channel[len(PREFIX):].split(':')
+        return (
+            (self.kind is None or self.kind == kind)
+            and (self.symbol_id is None or self.symbol_id == int(symbol_id))
+            and (self.timeframe_id is None or self.timeframe_id == int(timeframe_id))
+            and (self.strategy is None or strategy == [self.strategy])
+        )
+
+    def offer(self, data: bytes):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(data)
+
+
+class PushHub:
+    """One Redis pub/sub connection per API process, fanned out to its subscribers."""
+
+    def __init__(self) -> None:
+        self._subscribers: set[Subscriber] = set()
+        self._task: asyncio.Task | None = None
+        # subscriptions made so far, messages may be missing in between two
+        self.connects = 0
+
+    async def _run(self):
+        while True:
+            try:
+                client = aioredis.Redis(host=Config.REDIS_HOST)
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(f"{PREFIX}*")
+                    self.connects += 1
+                    async for message in pubsub.listen():
+                        if message["type"] != "pmessage":
+                            continue
+                        channel = message["channel"].decode()
+                        for subscriber in tuple(self._subscribers):
+                            if subscriber.matches(channel):
+                                subscriber.offer(message["data"])
+            except (RedisError, OSError) as e:
+                LOGGER.warning(f"push: {e}, reconnecting")
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    def subscribe(self, subscriber: Subscriber) -> Subscriber:
+        self._subscribers.add(subscriber)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        if subscriber.dropped:
+            LOGGER.info(f"push: subscriber dropped {subscriber.dropped} messages")
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "dropped": sum(s.dropped for s in self._subscribers),
+        }
+
+
+hub = PushHub()
@@ -0,0 +1,145 @@
+import asyncio
+
+import numpy as np
+import orjson
+from fastapi.concurrency import run_in_threadpool
+
+from .columnar import Candles, PRICE_COLUMNS
+from .crud import query_latest_candles
+from .push import hub, Subscriber
+import logging
+LOGGER = logging.getLogger("Spider.Ring")
+LOGGER.setLevel(logging.INFO)
+
+COLUMNS = ('ctm',) + PRICE_COLUMNS
+FOLLOW_BACKOFF = 1.0  # seconds before the first retry of a failed follower, doubled up to the max
+FOLLOW_BACKOFF_MAX = 60.0
+
+
+class CandleRing:
+    """Latest `capacity` candles of one pair, oldest first, in preallocated columns."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._data = {k: np.empty(capacity, np.int64 if k == 'ctm' else np.float64) for k in COLUMNS}
+        self._start = 0
+        self.size = 0
+
+    def _index(self, i: int) -> int:
+        return (self._start + i) % self.capacity
+
+    @property
+    def last_ctm(self) -> int:
+        return int(self._data['ctm'][self._index(self.size - 1)]) if self.size else -1
+
+    def clear(self):
+        self._start = self.size = 0
+
+    def _append(self, candles: Candles, i: int):
+        if self.size < self.capacity:
+            j = self._index(self.size)
+            self.size += 1
+        else:
+            j = self._start
+            self._start = (self._start + 1) % self.capacity
+        for k in COLUMNS:
+            self._data[k][j] = getattr(candles, k)[i]
+
+    def extend(self, candles: Candles):
+        """Add candles newer than the last one, which gets replaced when sent again.
+        Older candles within the ring, gap repairs, are merged in."""
+        first_ctm = int(self._data['ctm'][self._start]) if self.size else -1
+        repairs = (candles.ctm >= first_ctm) & (candles.ctm < self.last_ctm)
+        if repairs.any():
+            # sent candles first, np.unique keeps them over the held ones
+            merged = candles.concat(self.latest(self.size))
+            _, keep = np.unique(merged.ctm, return_index=True)
+            keep = keep[merged.ctm[keep] >= first_ctm]
+            self.clear()
+            candles = Candles(*(getattr(merged, k)[keep] for k in COLUMNS))
+        for i in np.argsort(candles.ctm, kind='stable'):
+            ctm = int(candles.ctm[i])
+            if ctm > self.last_ctm:
+                self._append(candles, i)
+            elif ctm == self.last_ctm:
+                j = self._index(self.size - 1)
+                for k in PRICE_COLUMNS:
+                    self._data[k][j] = getattr(candles, k)[i]
+
+    def latest(self, n: int) -> Candles:
+        """Return: latest n candles, oldest first."""
+        n = min(n, self.size)
+        idx = (self._start + np.arange(self.size - n, self.size)) % self.capacity
+        return Candles(*(self._data[k][idx] for k in COLUMNS))
+
+
+class RingCache:
+    """Rings of configured pairs, warmed from Postgres and kept current by candle pushes."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.rings: dict[tuple[int, int], CandleRing] = {}
+        self._task: asyncio.Task | None = None
+        self._connects = 0
+        # until (re)warmed, rings may miss candles: reads go to the database
+        self.stale = True
+        self.hits = 0
+        self.misses = 0
+
+    async def warm(self, pairs: list[tuple[int, int]]):
+        """(Re)load every ring from the database."""
+        self._connects = hub.connects
+        for pair in pairs:
+            candles = await run_in_threadpool(query_latest_candles, *pair, self.capacity)
+            ring = self.rings.setdefault(pair, CandleRing(self.capacity))
+            ring.clear()
+            ring.extend(candles)
+        self.stale = False
+        LOGGER.info(f"ring: warmed {len(pairs)} pairs")
+
+    async def _follow(self, subscriber: Subscriber):
+        dropped = subscriber.dropped
+        backoff = FOLLOW_BACKOFF
+        while True:
+            try:
+                if self.stale:
+                    dropped = subscriber.dropped
+                    await self.warm(list(self.rings))
+                message = orjson.loads(await subscriber.queue.get())
+                # pushes may be missing since the last load, reload
+                if hub.connects != self._connects or subscriber.dropped != dropped:
+                    dropped = subscriber.dropped
+                    await self.warm(list(self.rings))
+                ring = self.rings.get((message['symbol_id'], message['timeframe_id']))
+                if ring is not None:
+                    ring.extend(Candles.from_dict(message))
+                backoff = FOLLOW_BACKOFF
+            except Exception as err:
+                # pushes are lost meanwhile, serve from the database until re-warmed
+                self.stale = True
+                LOGGER.error(f"ring: follow failed, re-warm in {backoff}s - {err!r}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, FOLLOW_BACKOFF_MAX)
+
+    async def start(self, pairs: list[tuple[int, int]]):
+        subscriber = hub.subscribe(Subscriber('candles', size=4096))
+        await self.warm(pairs)
+        self._task = asyncio.create_task(self._follow(subscriber))
+
+    def latest(self, symbol_id: int, timeframe_id: int, n: int) -> Candles | None:
+        """Return: latest n candles from the ring, None if it cannot serve them all.
+        A ring short of n candles is not taken for the whole history: backfill
+        and ingest store candles without pushing them. Stale rings serve nothing."""
+        ring = self.rings.get((symbol_id, timeframe_id))
+        if ring is None or self.stale or n > ring.size:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return ring.latest(n)
+
+    def stats(self) -> dict:
+        return {
+            "pairs": len(self.rings), "capacity": self.capacity,
+            "bytes": sum(sum(a.nbytes for a in r._data.values()) for r in self.rings.values()),
+            "hits": self.hits, "misses": self.misses, "stale": self.stale,
+        }
@@ -1,9 +1,34 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from typing import Literal
 
-from .tasks import collect_candles
-from .crud import error_message, query_ct, get_candles
+import orjson
+from celery import group
+from fastapi import APIRouter, Body, HTTPException, Path, Query, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+
+from .tasks import collect_candles, collect_all_candles, plan_backfill, check_resample
+from .cache import cached_response
+from .schemas import CandlePair, MAX_TASK_IDS
+from .crud import (
+    error_message, query_ct, get_candles, query_candle_page, stream_candles, rollup_candles, decode_cursor,
+    query_latest_candles
+)
+from .export import ENCODERS, MEDIA_TYPES
+from .push import hub, Subscriber
+from .ring import RingCache
+from .exchange import Exchange
+from ..config import Config
 
 router = APIRouter()
+rings = RingCache(Config.RING_CAPACITY)
+
+
+async def warm_rings():
+    """Load the rings, once the candles table is migrated: called by the API startup."""
+    if Config.RING_CAPACITY > 0:
+        pairs = Exchange.SYMBOL_DEFAULT + Exchange.SYMBOL_SUBSCRIBE
+        await rings.start([(Exchange.SYMBOL_ID[s], Exchange.PERIOD_ID[p]) for s, p in pairs])
 
 
 @router.post("/{symbol}/{period}", response_description="Candles collection task to Workers")
@@ -15,17 +40,172 @@ def send_task_candles(symbol: str, period: int):
     return {"task_id": task.id}
 
 
+@router.post("/batch", response_description="Candles collection tasks of many pairs to Workers, as one group")
+def send_task_batch_candles(pairs: list[CandlePair] = Body(max_length=MAX_TASK_IDS)):
+    res = group(
+        collect_candles.s(pair.symbol, pair.period).set(queue='pool_solo') for pair in pairs
+    ).apply_async()
+    return {"group_id": res.id, "task_ids": [r.id for r in res.results]}
+
+
+@router.post("/all", response_description="All default pairs collection task to Workers")
+def send_task_all_candles():
+    task = collect_all_candles.apply_async(queue='pool_solo')
+    return {"task_id": task.id}
+
+
+@router.post("/backfill/{symbol}/{period}", response_description="History backfill planning task to Workers")
+def send_task_backfill(symbol: str, period: int):
+    task = plan_backfill.apply_async(
+        args=(symbol, period),
+        queue='pool_solo'
+    )
+    return {"task_id": task.id}
+
+
+@router.post("/check/{symbol}/{period}", response_description="Derived vs fetched bars check task to Workers")
+def send_task_check_resample(symbol: str, period: int):
+    task = check_resample.apply_async(
+        args=(symbol, period),
+        queue='pool_solo'
+    )
+    return {"task_id": task.id}
+
+
 @router.get("/{symbol_id}/{period_id}", response_description="Candles sample from database")
 def get_sample_candles(symbol_id: int, period_id: int):
-    candles = get_candles(symbol_id, period_id)
-    if not candles:
+    body = cached_response(
+        'sample', symbol_id, period_id, (),
+        lambda: [c.model_dump() for c in get_candles(symbol_id, period_id) or []] or None,
+    )
+    if body == 'null':
         raise HTTPException(404, error_message(f"Not found - S:{symbol_id}/T:{period_id}"))
-    return candles
+    return Response(body, media_type="application/json")
+
+
+@router.get("/latest/{symbol_id}/{period_id}", response_description="Latest candles, columnar, from memory")
+async def get_latest_candles(symbol_id: int, period_id: int, n: int = Query(300, ge=1, le=5000)):
+    candles = rings.latest(symbol_id, period_id, n)
+    if candles is None:
+        candles = await run_in_threadpool(query_latest_candles, symbol_id, period_id, n)
+    return Response(orjson.dumps(candles.to_dict()), media_type="application/json")
+
+
+@router.get("/range/{symbol_id}/{period_id}", response_description="Candles of a time range, page by page")
+def get_range_candles(
+        symbol_id: int,
+        period_id: int,
+        ctm_from: int = Query(0, alias="from", description="Inclusive, ms"),
+        ctm_until: int = Query(2 ** 62, alias="to", description="Exclusive, ms"),
+        cursor: str | None = None,
+        limit: int = Query(1000, ge=1, le=5000),
+):
+    try:
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(400, error_message(str(e)))
+
+    def page():
+        candles, next_cursor = query_candle_page(symbol_id, period_id, ctm_from, ctm_until, cursor, limit)
+        return {"candles": candles, "next": next_cursor}
+    body = cached_response('range', symbol_id, period_id, (ctm_from, ctm_until, cursor, limit), page)
+    return Response(body, media_type="application/json")
+
+
+@router.get("/export/{symbol_id}/{period_id}", response_description="Candles of a time range as one streamed file")
+def export_candles(
+        symbol_id: int,
+        period_id: int,
+        ctm_from: int = Query(0, alias="from", description="Inclusive, ms"),
+        ctm_until: int = Query(2 ** 62, alias="to", description="Exclusive, ms"),
+        fmt: Literal['arrow', 'parquet', 'ndjson'] = Query('arrow', alias="format"),
+):
+    batches = stream_candles(symbol_id, period_id, ctm_from, ctm_until)
+    return StreamingResponse(
+        ENCODERS[fmt](batches),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="candles_{symbol_id}_{period_id}.{fmt}"'},
+    )
+
+
+@router.get("/aggregate/{symbol_id}/{bucket}", response_description="OHLCV bars of `bucket` minutes, rolled up in database")
+def get_aggregate_candles(
+        symbol_id: int,
+        bucket: int = Path(gt=0, description="Minutes"),
+        ctm_from: int = Query(0, alias="from", description="Inclusive, ms"),
+        ctm_until: int = Query(..., alias="to", description="Exclusive, ms"),
+):
+    body = rollup_candles(symbol_id, bucket, ctm_from, ctm_until)
+    if body is None:
+        raise HTTPException(404, error_message(f"No base period for S:{symbol_id}/B:{bucket}"))
+    return Response(body, media_type="application/json")
 
 
 @router.get("/ct/{symbol_id}/{period_id}", response_description="Candles stats from database")
 def get_ct(symbol_id: int, period_id: int):
-    ct = query_ct(symbol_id, period_id)
-    if not ct:
+    body = cached_response(
+        'ct', symbol_id, period_id, (),
+        lambda: ct.model_dump() if (ct := query_ct(symbol_id, period_id)) else None,
+    )
+    if body == 'null':
         raise HTTPException(404, error_message(f"Not found - S:{symbol_id}/T:{period_id}"))
-    return ct
+    return Response(body, media_type="application/json")
+
+
+SSE_KEEPALIVE = 15.0
+
+
+@router.websocket("/ws")
+async def push_ws(
+        websocket: WebSocket,
+        kind: Literal['candles', 'ta'] | None = None,
+        symbol_id: int | None = None,
+        timeframe_id: int | None = None,
+        strategy: str | None = None,
+):
+    """Push new candles & TA results, filtered by kind, symbol, timeframe and strategy"""
+    await websocket.accept()
+    subscriber = hub.subscribe(Subscriber(kind, symbol_id, timeframe_id, strategy))
+
+    async def receive():
+        # client messages are ignored, a disconnect ends the push even while nothing is sent
+        while (await websocket.receive())['type'] != 'websocket.disconnect':
+            pass
+
+    async def send():
+        while True:
+            await websocket.send_text((await subscriber.queue.get()).decode())
+
+    tasks = (asyncio.create_task(receive()), asyncio.create_task(send()))
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for t in tasks:
+            t.cancel()
+        # a send after the disconnect fails, nothing to report
+        await asyncio.gather(*tasks, return_exceptions=True)
+        hub.unsubscribe(subscriber)
+
+
+@router.get("/events", response_description="Server-Sent Events of new candles & TA results")
+async def push_sse(
+        kind: Literal['candles', 'ta'] | None = None,
+        symbol_id: int | None = None,
+        timeframe_id: int | None = None,
+        strategy: str | None = None,
+):
+    subscriber = hub.subscribe(Subscriber(kind, symbol_id, timeframe_id, strategy))
+
+    async def events():
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(subscriber.queue.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield b"data: " + data + b"\n\n"
+        finally:
+            hub.unsubscribe(subscriber)
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,86 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from celery.schedules import schedule, schedstate
+
+from ..database import redis_conn
+from .bars import MINUTE_MS, bar_open
+from .exchange import Exchange
+
+SKEW_KEY = "xtb:server_skew_ms"
+SKEW_TTL = 300.0
+_skew = {"ms": 0, "read": 0.0}
+
+
+def server_skew_ms() -> int:
+    """Return: XTB server clock minus local clock (ms), cached from Redis."""
+    if time.monotonic() - _skew["read"] > SKEW_TTL:
+        value = redis_conn().get(SKEW_KEY)
+        _skew["ms"] = int(value) if value else 0
+        _skew["read"] = time.monotonic()
+    return _skew["ms"]
+
+
+def store_server_skew(server_ms: int, local_ms: int):
+    """Save XTB server clock skew for schedulers of every process."""
+    redis_conn().set(SKEW_KEY, server_ms - local_ms)
+
+
+def market_open(ctm: int, symbol: str) -> bool:
+    """Return: whether symbol trades at ctm (ms).
+    Weekend close runs from Friday 22:00 to Sunday 22:00 UTC."""
+    if symbol in Exchange.SYMBOL_WEEKEND:
+        return True
+    dt = datetime.fromtimestamp(ctm / 1000, timezone.utc)
+    weekday, hour = dt.weekday(), dt.hour
+    if weekday == 5:
+        return False
+    if weekday == 4:
+        return hour < 22
+    if weekday == 6:
+        return hour >= 22
+    return True
+
+
+class bar_close(schedule):
+    """Fire `delay` seconds after each `period` minutes bar of symbol closes,
+    on XTB server time, skipping bars that closed while the market was shut."""
+
+    def __init__(self, symbol: str, period: int, delay: float = 5.0, nowfun=None, app=None):
+        self.symbol = symbol
+        self.period = period
+        self.delay = delay
+        super().__init__(run_every=timedelta(minutes=period), nowfun=nowfun, app=app)
+
+    def _due_ms(self, server_ms: int) -> int:
+        """Return: latest due time (server ms) not after server_ms."""
+        delay_ms = int(self.delay * 1000)
+        return bar_open(server_ms - delay_ms, self.period) + delay_ms
+
+    def is_due(self, last_run_at: datetime) -> schedstate:
+        skew = server_skew_ms()
+        local_ms = int(self.now().timestamp() * 1000)
+        server_ms = local_ms + skew
+        due = self._due_ms(server_ms)
+        next_due = due + self.period * MINUTE_MS
+        remaining = max(1.0, (next_due - server_ms) / 1000)
+
+        last_ms = int(self.maybe_make_aware(last_run_at).timestamp() * 1000) + skew
+        closed_bar = due - int(self.delay * 1000) - 1
+        if last_ms < due and market_open(closed_bar, self.symbol):
+            return schedstate(is_due=True, next=remaining)
+        return schedstate(is_due=False, next=remaining)
+
+    def __repr__(self):
+        return f"<bar_close: {self.symbol} {self.period}m +{self.delay}s>"
+
+    def __reduce__(self):
+        return self.__class__, (self.symbol, self.period, self.delay, self.nowfun)
+
+    def __eq__(self, other):
+        if isinstance(other, bar_close):
+            return (self.symbol, self.period, self.delay) == (other.symbol, other.period, other.delay)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.symbol, self.period, self.delay))
@@ -1,5 +1,5 @@
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import date
 
 
@@ -14,13 +14,12 @@ class CandleBase(BaseModel):
 
 
 class CandleIn(CandleBase):
-    id: int
     symbol_id: Optional[int] = 0
     timeframe_id: Optional[int] = 0
 
     def as_tuple(self):
         return (
-            self.id, self.symbol_id, self. timeframe_id, self.ctm, self.ctmstring,
+            self.symbol_id, self. timeframe_id, self.ctm,
             self.open, self.close, self.high, self.low, self.vol
         )
 
@@ -29,6 +28,19 @@ class CandleOut(CandleBase):
     pass
 
 
+class CandlePair(BaseModel):
+    symbol: str
+    period: int
+
+
+MAX_TASK_IDS = 1000
+
+
+class TaskIds(BaseModel):
+    task_ids: list[str] = Field(max_length=MAX_TASK_IDS)
+    wait: float = 0
+
+
 class CandleStatBase(BaseModel):
     symbol_id: int
     timeframe_id: int
@@ -37,9 +49,10 @@ class CandleStatBase(BaseModel):
     date_from: date
     date_until: date
     digits: int
+    ctm_until: Optional[int] = None
 
     def as_tuple(self):
         return (
             self.id, self.symbol_id, self. timeframe_id, self.symbol, self.period,
-            self.date_from, self.date_until, self.digits
+            self.date_from, self.date_until, self.digits, self.ctm_until
         )
@@ -0,0 +1,147 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from .XTBApi import Client, CommandFailed, SocketError, COMMAND_INTERVAL
+import logging
+LOGGER = logging.getLogger("Spider.Session")
+LOGGER.setLevel(logging.INFO)
+
+PENALTY = 5.0  # seconds an account is held back after a failed command
+EWMA_ALPHA = 0.2
+
+
+class TokenBucket:
+    """Token bucket of `rate` tokens per second, holding up to `burst` tokens"""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost: float = 1) -> float:
+        """Return: seconds until `cost` tokens are available."""
+        self._refill()
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+    def reserve(self, cost: float = 1) -> float:
+        """Take `cost` tokens, possibly going into debt. Return: seconds to wait before use."""
+        wait = self.delay(cost)
+        self.tokens -= cost
+        return wait
+
+    def hold(self, seconds: float):
+        """Drain the bucket so no token is available for `seconds`."""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class SessionPool:
+    """One warm logged-in Client per account, handed out by a token-bucket scheduler"""
+
+    def __init__(
+            self,
+            accounts: dict[str, dict],
+            rate: float = 1 / COMMAND_INTERVAL,
+            burst: float = 5,
+            url: str | None = None,
+    ) -> None:
+        self._accounts = accounts
+        self._url = url
+        self._clients: dict[str, Client] = {}
+        self._buckets = {user: TokenBucket(rate, burst) for user in accounts}
+        self._latency = {user: 0.0 for user in accounts}
+        self._busy: set[str] = set()
+        self._stale: set[str] = set()
+        self._cond = threading.Condition()
+
+    def _client(self, user: str) -> Client:
+        """Return: logged-in client of the account, login lazily."""
+        client = self._clients.get(user)
+        if client is None:
+            account = self._accounts[user]
+            client = Client(user, token=account.get('pass', ''), mode=account.get('mode', 'real'), url=self._url)
+            client.login()
+            client.start_keepalive()
+            self._clients[user] = client
+        elif user in self._stale:
+            client.reconnect()
+        self._stale.discard(user)
+        return client
+
+    def warm(self):
+        """Login every account upfront."""
+        for user in self._accounts:
+            try:
+                self._client(user)
+            except (CommandFailed, SocketError) as err:
+                LOGGER.error(f"{user}: {err}")
+
+    def _pick(self, cost: float) -> str | None:
+        """Return: idle account with the earliest available tokens, weighted by latency."""
+        idle = [user for user in self._accounts if user not in self._busy]
+        if not idle:
+            return None
+        return min(idle, key=lambda user: self._buckets[user].delay(cost) + self._latency[user])
+
+    @contextmanager
+    def acquire(self, cost: float = 1):
+        """Hand out a client for `cost` commands, exclusive while in use."""
+        with self._cond:
+            user = self._pick(cost)
+            while user is None:
+                self._cond.wait()
+                user = self._pick(cost)
+            self._busy.add(user)
+            wait = self._buckets[user].reserve(cost)
+
+        if wait > 0:
+            time.sleep(wait)
+        started = time.monotonic()
+        try:
+            yield self._client(user)
+        except (CommandFailed, SocketError):
+            with self._cond:
+                self._buckets[user].hold(PENALTY)
+                self._stale.add(user)
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._latency[user] += EWMA_ALPHA * (elapsed / cost - self._latency[user])
+                self._busy.discard(user)
+                self._cond.notify()
+
+    def stats(self) -> dict[str, dict]:
+        """Return: scheduler state per account."""
+        with self._cond:
+            return {
+                user: {
+                    "logged": user in self._clients,
+                    "busy": user in self._busy,
+                    "session": self._clients[user].health() if user in self._clients else {},
+                    "latency": round(self._latency[user], 3),
+                    "tokens": round(self._buckets[user].tokens, 2),
+                }
+                for user in self._accounts
+            }
+
+
+_pool: SessionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(accounts: dict[str, dict], url: str | None = None) -> SessionPool:
+    """Return: process-wide session pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SessionPool(accounts, url=url)
+            _pool.warm()
+    return _pool
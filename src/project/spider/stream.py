@@ -0,0 +1,141 @@
+import os
+import time
+from collections import defaultdict
+from datetime import date
+
+from psycopg2 import Error as DatabaseError
+from redis.exceptions import RedisError
+
+from ..config import Config
+from .bars import BarAggregator
+from .columnar import Candles
+from .crud import query_ct, update_ct, upsert_candles
+from .exchange import Exchange, account
+from .push import publish_candles
+from .XTBApi import Client, StreamClient, CommandFailed, SocketError
+import logging
+LOGGER = logging.getLogger("Spider.Stream")
+LOGGER.setLevel(logging.INFO)
+
+PING_INTERVAL = 30.0
+
+
+class CandleStreamIngester:
+    """Long-running ingester of XTB streamed M1 candles.
+    Closed bars of every configured period are written in micro-batches."""
+
+    def __init__(
+            self,
+            client: Client,
+            pairs: tuple[tuple[str, int], ...],
+            flush_size: int = 100,
+            flush_interval: float = 5.0,
+            url: str | None = None,
+    ) -> None:
+        self.client = client
+        self.url = url
+        self.pairs = pairs
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.stream: StreamClient | None = None
+        self._aggregators: dict[str, list[BarAggregator]] = defaultdict(list)
+        self._buffer: dict[tuple[str, int], list[dict]] = defaultdict(list)
+        self._flushed = time.monotonic()
+        self._flush_failed = False
+        self._pinged = time.monotonic()
+
+    def _digits(self, symbol: str) -> int:
+        """Return: price precision of symbol."""
+        res = self.client.get_symbol(symbol)
+        return res.get('returnData', {}).get('precision', 0)
+
+    def subscribe(self):
+        """Login, open the stream and subscribe every configured symbol."""
+        self.client.login()
+        self.stream = StreamClient(self.client.stream_session_id, mode='real', url=self.url)
+        self.stream.connect()
+        self._aggregators.clear()
+        for symbol in sorted({symbol for symbol, _ in self.pairs}):
+            digits = self._digits(symbol)
+            self._aggregators[symbol] = [
+                BarAggregator(period, digits) for s, period in self.pairs if s == symbol
+            ]
+            self.stream.get_candles(symbol)
+
+    def on_candle(self, candle: dict):
+        """Feed a streamed M1 candle to the aggregators of its symbol."""
+        for agg in self._aggregators.get(candle.get('symbol'), []):
+            bars = agg.add(candle)
+            if bars:
+                self._buffer[(candle['symbol'], agg.period)].extend(bars)
+
+    def flush(self):
+        """Write buffered closed bars and update candles stats - date_until.
+        The high-water mark is left to polling: it repairs from there, holes of
+        stream outages included. Bars of pairs that fail stay buffered for the next flush."""
+        failed = 0
+        for (symbol, period), bars in list(self._buffer.items()):
+            symbol_id = Exchange.SYMBOL_ID.get(symbol)
+            period_id = Exchange.PERIOD_ID.get(period)
+            candles = Candles.from_rate_infos(bars)
+            try:
+                rowcount = upsert_candles(symbol_id, period_id, candles)
+                LOGGER.info(f"{symbol}/{period}: {len(bars)} bars, inserted={rowcount}")
+                ct = query_ct(symbol_id, period_id)
+                if ct:
+                    publish_candles(symbol_id, period_id, candles, ct.digits)
+                    present_ctm = max(b['ctm'] for b in bars)
+                    ct.date_until = max(ct.date_until, date.fromtimestamp(present_ctm / 1000))
+                    update_ct(ct)
+            except (DatabaseError, RedisError, OSError) as err:
+                LOGGER.error(f"{symbol}/{period}: flush of {len(bars)} bars failed, kept - {err!r}")
+                failed += 1
+                continue
+            del self._buffer[(symbol, period)]
+        self._flush_failed = failed > 0
+        self._flushed = time.monotonic()
+
+    def _keepalive(self):
+        """Ping both sockets, the server drops idle sessions."""
+        if time.monotonic() - self._pinged < PING_INTERVAL:
+            return
+        self.client.ping()
+        self.stream.ping()
+        self._pinged = time.monotonic()
+
+    def run_once(self):
+        """Receive and dispatch one message, flush when the batch is due."""
+        msg = self.stream.recv(timeout=1.0)
+        if msg and msg.get('command') == 'candle':
+            self.on_candle(msg['data'])
+        n_buffered = sum(len(bars) for bars in self._buffer.values())
+        # after a failed flush, retry on the interval only
+        if (n_buffered >= self.flush_size and not self._flush_failed) or (
+                n_buffered and time.monotonic() - self._flushed >= self.flush_interval):
+            self.flush()
+        self._keepalive()
+
+    def run(self):
+        """Run forever, resubscribe after socket, database & Redis errors.
+        Buffered bars are kept over resubscriptions."""
+        while True:
+            try:
+                self.subscribe()
+                while True:
+                    self.run_once()
+            except (CommandFailed, SocketError, DatabaseError, RedisError, OSError) as err:
+                LOGGER.error(repr(err))
+                if self.stream:
+                    self.stream.close()
+                time.sleep(5)
+
+
+if __name__ == '__main__':
+    user = os.getenv('WORKER_ID', '')
+    token = account(user).get('pass', '')
+    ingester = CandleStreamIngester(
+        Client(user, token=token, mode='real', url=Config.XTB_URL or None),
+        pairs=Exchange.SYMBOL_DEFAULT + Exchange.SYMBOL_SUBSCRIBE,
+        url=Config.XTB_URL or None,
+    )
+    ingester.run()
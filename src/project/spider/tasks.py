@@ -1,142 +1,472 @@
-from datetime import datetime, date, timedelta, timezone
+import asyncio
+import logging
+import time
+from datetime import datetime, date, time as dt_time, timedelta, timezone
+from celery import group
 from celery.app import task
 from celery.schedules import crontab
 from pymongo.database import Database
-from pandas import DataFrame
-from pandas_ta import Strategy
 
+from ..config import Config
 from ..worker import app, CandleTask, TATask
-from .exchange import Exchange
-from .schemas import CandleIn, CandleStatBase
+from .exchange import Exchange, account, pool_accounts
+from .columnar import Candles, decode_chart
+from .schemas import CandleStatBase
+from .XTBApi import AsyncClient, CommandFailed, SocketError
+from .backfill import plan_chunks, contiguous_date_from
+from .bars import bar_open, next_bar_open, resample, compare_bars
+from .schedules import bar_close, store_server_skew
+from .partitions import ensure_partitions, drop_expired_partitions
+from .push import publish_candles, publish_ta
+from .indicators import Indicators
 from .crud import (
-    query_ct, insert_ct, update_ct, upsert_many_candles,
+    query_ct, get_or_insert_ct, update_ct, upsert_candles, query_latest_candles, query_candles,
+    _get_chart_from_ts, _get_chart_range,
     gather_present_candles, gather_olden_candles,
-    bulk_upsert
+    async_gather_present_candles, bulk_upsert,
+    extend_ct_date_from, insert_backfill_chunks, query_backfill_chunks, finish_backfill_chunk
 )
+LOGGER = logging.getLogger("Spider.Tasks")
+LOGGER.setLevel(logging.INFO)
+
+
+TA_TICKS = 300
+BAR_CLOSE_DELAY = 5.0  # seconds after bar close, for the server to finish the bar
+BAR_CLOSE_STAGGER = 2.0  # seconds between pairs of the same period, per account
+RESAMPLE_LOOKAHEAD = 4 * 24 * 3600 * 1000  # ms past backfilled candles, longer than market closes
 
 
 @app.on_after_configure.connect
 def setup_cron_tasks(sender, **kwargs):
-    # Execute every 15 minutes, on Workdays.
-    for symbol, period in Exchange.SYMBOL_DEFAULT + Exchange.SYMBOL_SUBSCRIBE:
-        sender.add_periodic_task(
-            crontab(minute='*/15', hour='*', day_of_week='mon-fri'),
-            collect_candles.s(
-                args=(symbol, period),
-                queue='pool_solo'
+    # Keep the local view of XTB server time fresh, every hour.
+    sender.add_periodic_task(
+        crontab(minute='0'),
+        sync_server_time.s().set(queue='pool_solo'),
+        name='sync_server_time'
+    )
+    # Pre-create next year's candles partition and drop expired ones, daily.
+    sender.add_periodic_task(
+        crontab(minute='30', hour='0'),
+        maintain_partitions.s().set(queue='pool_solo'),
+        name='maintain_partitions'
+    )
+    pairs = Exchange.SYMBOL_DEFAULT + Exchange.SYMBOL_SUBSCRIBE
+    # With resampling on, only the finest period of each symbol is collected.
+    if Config.XTB_RESAMPLE:
+        pairs = tuple((symbol, base) for symbol, (base, _) in CandleTask.derive_plan.items())
+    # With the streaming ingester on, polling only repairs gaps, once an hour.
+    if Config.XTB_STREAM:
+        for symbol, period in pairs:
+            sender.add_periodic_task(
+                crontab(minute='7', hour='*', day_of_week='mon-fri'),
+                collect_candles.s(symbol, period).set(queue='pool_solo'),
+                name=f'collect_candles {symbol} {period}'
             )
+        return
+    # Execute just after each bar closes, staggered so that each account
+    # takes one pair of the same period at a time.
+    n_accounts = max(1, len(Exchange.ACCOUNTS)) if Config.XTB_POOL else 1
+    seen: dict[int, int] = {}
+    for symbol, period in pairs:
+        rank = seen.get(period, 0)
+        seen[period] = rank + 1
+        delay = BAR_CLOSE_DELAY + (rank // n_accounts) * BAR_CLOSE_STAGGER
+        sender.add_periodic_task(
+            bar_close(symbol, period, delay=delay, app=sender),
+            collect_candles.s(symbol, period).set(queue='pool_solo'),
+            name=f'collect_candles {symbol} {period}'
         )
 
 
 @app.task(base=CandleTask, bind=True)
-def collect_candles(self: task, symbol: str, period: int):
-    """Worker task to collect candles by symbol & period"""
+def sync_server_time(self: task):
+    """Worker task to record XTB server clock skew for the schedulers"""
+    with self.session() as client:
+        local_ms = int(time.time() * 1000)
+        res = client.get_server_time()
+    # assume the server read its clock half way through the round trip
+    local_ms += int(client.latency * 500)
+    server_ms = res.get('returnData', {}).get('time', local_ms)
+    store_server_skew(server_ms, local_ms)
+    return {"skew_ms": server_ms - local_ms}
 
-    symbol_id: int = self.symbol_ids.get(symbol)
-    period_id: int = self.period_ids.get(period)
 
-    # get candles stats
+@app.task
+def maintain_partitions():
+    """Worker task to create this and next year's candles partitions and drop expired ones"""
+    now_ms = int(time.time() * 1000)
+    ensure_partitions(now_ms, now_ms + 366 * 24 * 3600 * 1000)
+    dropped = drop_expired_partitions(Config.PGSQL_RETENTION_YEARS)
+    return {"dropped": dropped}
+
+
+def _get_or_insert_ct(symbol_id: int, period_id: int, symbol: str, period: int) -> CandleStatBase:
+    """Query candles stats, insert a fresh one if missing"""
     today_utc = datetime.now(timezone.utc).date()
-    _ct = CandleStatBase(
+    return get_or_insert_ct(CandleStatBase(
         symbol_id=symbol_id,
         timeframe_id=period_id,
         symbol=symbol, period=period, digits=0,
         date_from=today_utc, date_until=today_utc
-    )
-    ct = query_ct(symbol_id, period_id)
-    if not ct:
-        ct = insert_ct(_ct)
+    ))
 
-    # gather candles
-    candles, digits = gather_present_candles(ct, self.client)
-    olden_candles, _ = gather_olden_candles(ct, self.client)
+
+def _store_candles(
+        self: task,
+        ct: CandleStatBase,
+        candles: Candles,
+        olden_candles: Candles,
+        digits: int
+) -> bool:
+    """Store gathered candles, fire TA tasks and update candles stats.
+    Return: False if nothing new."""
+    symbol_id, period_id = ct.symbol_id, ct.timeframe_id
+
+    # present candles are fetched from the high-water mark on, inclusive:
+    # the candle there is stored already
+    if ct.ctm_until:
+        candles = candles.after(ct.ctm_until)
 
     # return if nothing new
     if not candles and not olden_candles:
-        return
+        return False
 
-    # create task technical analysis
-    for name, _ in self.presets.items():
-        upsert_technical_analysis.apply_async(
-            args=(name, symbol_id, period_id, digits, candles),
-            queue='pool_any'
-        )
+    # store new candles in DB, then push the present ones to subscribers
+    rowcount = upsert_candles(symbol_id, period_id, candles.concat(olden_candles))
+    publish_candles(symbol_id, period_id, candles, digits)
 
-    # store new candles in DB
-    model_candles = [CandleIn(
-        id=symbol_id * 10 + period_id + candle['ctm'],
-        symbol_id=symbol_id,
-        timeframe_id=period_id,
-        ctm=candle['ctm'],
-        ctmstring=candle['ctmString'],
-        open=candle['open'],
-        close=candle['close'],
-        high=candle['high'],
-        low=candle['low'],
-        vol=candle['vol']) for candle in candles + olden_candles]
-    rowcount = upsert_many_candles(model_candles)
+    # create task technical analysis, over the stored window for indicator warm-up;
+    # combined, one task computes every preset from one copy of the candles
+    if candles:
+        payload = query_latest_candles(symbol_id, period_id, TA_TICKS).to_dict()
+        if Config.XTB_TA_COMBINED:
+            upsert_all_technical_analysis.apply_async(
+                args=(symbol_id, period_id, digits, payload),
+                queue='pool_any'
+            )
+        else:
+            for name in self.presets:
+                upsert_technical_analysis.apply_async(
+                    args=(name, symbol_id, period_id, digits, payload),
+                    queue='pool_any'
+                )
 
     # update candles stats - date_from
-    olden_ts = 0 if not olden_candles else min([int(c['ctm']) for c in olden_candles]) / 1000
+    olden_ts = 0 if not olden_candles else int(olden_candles.ctm.min()) / 1000
     if rowcount >= 0 and olden_ts > datetime(2020, 7, 1).timestamp():
         ct.date_from = date.fromtimestamp(olden_ts) + timedelta(days=1)
-    # update candles stats - date_until
+    # update candles stats - date_until & high-water mark
     if candles:
-        present_ts = max([int(c['ctm']) for c in candles]) / 1000
-        ct.date_until = date.fromtimestamp(present_ts)
+        present_ctm = int(candles.ctm.max())
+        ct.date_until = date.fromtimestamp(present_ctm / 1000)
+        ct.ctm_until = max(ct.ctm_until or 0, present_ctm)
 
     ct.digits = digits
     update_ct(ct)
+    return True
+
+
+def _resample_stored(
+        ct: CandleStatBase,
+        candles: Candles,
+        period: int,
+        since: int | None = None,
+        closed_until: int = 0
+) -> Candles:
+    """Resample stored base candles around the new ones, whole derived bars included.
+    From `since` if earlier, the last derived bar, so that a bar left open by
+    the previous run is revisited. With `closed_until`, base candles are stored
+    up to there: read on over a break or weekend, to redo the first bar of the
+    newer candles that was cut, and close the last bar."""
+    if not candles:
+        return Candles.empty()
+    ctm_from = bar_open(int(candles.ctm.min()), period)
+    if since is not None:
+        ctm_from = min(ctm_from, since)
+    ctm_until = int(candles.ctm.max()) + 1
+    if closed_until:
+        ctm_until = min(next_bar_open(ctm_until + RESAMPLE_LOOKAHEAD, period), closed_until + 1)
+    stored = query_candles(ct.symbol_id, ct.timeframe_id, ctm_from, ctm_until)
+    # base history is stored from date_from on, bars opening after it are whole
+    covered_from = int(datetime.combine(ct.date_from, dt_time(), timezone.utc).timestamp() * 1000)
+    return resample(stored, ct.period, period, covered_from, closed_until)
+
+
+def _derive_candles(
+        self: task,
+        ct: CandleStatBase,
+        candles: Candles,
+        olden_candles: Candles,
+        digits: int
+):
+    """Build and store the periods derived from the base period of ct, if any"""
+    base, periods = self.derive_plan.get(ct.symbol, (0, []))
+    if not Config.XTB_RESAMPLE or ct.period != base:
+        return
+    for period in periods:
+        target = _get_or_insert_ct(ct.symbol_id, self.period_ids.get(period), ct.symbol, period)
+        _store_candles(
+            self, target,
+            _resample_stored(ct, candles, period, since=target.ctm_until),
+            _resample_stored(ct, olden_candles, period, closed_until=ct.ctm_until or 0),
+            digits
+        )
+
+
+@app.task(base=CandleTask, bind=True)
+def collect_candles(self: task, symbol: str, period: int):
+    """Worker task to collect candles by symbol & period"""
+
+    symbol_id: int = self.symbol_ids.get(symbol)
+    period_id: int = self.period_ids.get(period)
+
+    # get candles stats
+    ct = _get_or_insert_ct(symbol_id, period_id, symbol, period)
+
+    # gather candles
+    with self.session(cost=2) as client:
+        candles, digits = gather_present_candles(ct, client)
+        olden_candles, _ = gather_olden_candles(ct, client)
+
+    if not _store_candles(self, ct, candles, olden_candles, digits):
+        return
+    _derive_candles(self, ct, candles, olden_candles, digits)
 
     return {
+        "candles": len(candles) + len(olden_candles),
         "client": {
-            "user": self.user,
-            "ws": str(self._client.ws.socket),
+            "user": client._user,
+            "ws": str(client.ws.socket),
+            "health": client.health(),
         },
     }
 
 
-@app.task(base=TATask, bind=True)
-def upsert_technical_analysis(
-        self: task,
-        strategy: str,
-        symbol_id: int,
-        period_id: int,
-        digits: int,
-        candles: list,
-):
-    """Worker task to upsert TA results by symbol & period"""
+async def _gather_account(user: str, account: dict, cts: list[CandleStatBase]) -> list[tuple[Candles, int]]:
+    """Gather present candles of pairs on one account's asyncio client"""
+    client = AsyncClient(user, token=account.get('pass', ''), mode=account.get('mode', 'real'),
+                         url=Config.XTB_URL or None)
+    try:
+        await client.login()
+        results = await async_gather_present_candles(cts, client)
+    except BaseException:
+        # failed or cancelled: drop the socket, a logout could hang as well
+        await client.close()
+        raise
+    try:
+        await client.logout()
+    except (CommandFailed, SocketError, TimeoutError) as err:
+        LOGGER.warning(f"{user}: logout failed - {err!r}")
+    return results
+
+
+async def _gather_all(accounts: dict[str, dict], cts: list[CandleStatBase]) -> list[tuple[Candles, int]]:
+    """Gather present candles of all pairs in one event loop, spread round-robin over accounts.
+    Each account sends one command per COMMAND_INTERVAL, so this takes about
+    len(cts) / len(accounts) intervals."""
+    users = list(accounts)
+    shares = [cts[i::len(users)] for i in range(len(users))]
+    gathered = await asyncio.gather(*[
+        _gather_account(user, accounts[user], share) for user, share in zip(users, shares)
+    ], return_exceptions=True)
+    # pairs of a failed account are left empty, the other accounts' candles are kept
+    results: list[tuple[Candles, int]] = [(Candles.empty(), 0)] * len(cts)
+    for i, (user, share_results) in enumerate(zip(users, gathered)):
+        if isinstance(share_results, BaseException):
+            LOGGER.error(f"{user}: gathering {len(shares[i])} pairs failed - {share_results!r}")
+            continue
+        results[i::len(users)] = share_results
+    return results
+
+
+@app.task(base=CandleTask, bind=True)
+def collect_all_candles(self: task):
+    """Worker task to collect present candles of every default pair concurrently"""
 
-    db: Database = self.db
-    presets: dict[str, list] = self.presets
+    pairs = Exchange.SYMBOL_DEFAULT
+    # With resampling on, only the finest period of each symbol is collected.
+    if Config.XTB_RESAMPLE:
+        pairs = tuple((symbol, period) for symbol, period in pairs
+                      if period == self.derive_plan.get(symbol, (period, []))[0])
+    cts = [
+        _get_or_insert_ct(self.symbol_ids.get(symbol), self.period_ids.get(period), symbol, period)
+        for symbol, period in pairs
+    ]
+    # With the session pool on, every account takes a share of the pairs.
+    if Config.XTB_POOL:
+        accounts = pool_accounts()
+    else:
+        accounts = {self.user: account(self.user)}
+    results = asyncio.run(_gather_all(accounts, cts))
 
-    # prepare data
-    candles.sort(key=lambda by: by['ctm'])
-    df = DataFrame(candles)
+    n_stored = 0
+    for ct, (candles, digits) in zip(cts, results):
+        if _store_candles(self, ct, candles, Candles.empty(), digits):
+            n_stored += 1
+            _derive_candles(self, ct, candles, Candles.empty(), digits)
+
+    return {
+        "client": {
+            "users": list(accounts),
+        },
+        "pairs": len(cts),
+        "stored": n_stored,
+    }
+
+
+@app.task(base=CandleTask, bind=True)
+def check_resample(self: task, symbol: str, period: int, ticks: int = 100):
+    """Worker task to compare derived bars of symbol & period against fetched ones"""
+
+    base, periods = self.derive_plan.get(symbol, (0, []))
+    if period not in periods:
+        return {"error": f"{symbol}/{period} is not derived"}
+
+    ts = int(datetime.now(timezone.utc).timestamp())
+    with self.session(cost=2) as client:
+        fetched, _ = _get_chart_from_ts(client, ts, symbol, period, tick=-ticks)
+        if not fetched:
+            return {"error": f"{symbol}/{period} no candles"}
+        start = bar_open(int(fetched.ctm.min()), period) // 1000
+        base_candles, _ = _get_chart_range(client, start, ts, symbol, base, tick=0)
+
+    report = compare_bars(resample(base_candles, base, period), fetched)
+    report.update({"symbol": symbol, "period": period, "base": base})
+    return report
+
+
+@app.task(base=CandleTask, bind=True)
+def plan_backfill(self: task, symbol: str, period: int):
+    """Worker task to split missing history into chunks and fan them out"""
+
+    symbol_id: int = self.symbol_ids.get(symbol)
+    period_id: int = self.period_ids.get(period)
+    ct = _get_or_insert_ct(symbol_id, period_id, symbol, period)
+
+    chunks = insert_backfill_chunks(symbol_id, period_id, plan_chunks(ct))
+    if not chunks:
+        return {"chunks": 0}
+
+    res = group(
+        backfill_chunk.s(chunk.id, symbol, period, chunk.ctm_from, chunk.ctm_until)
+        for chunk in chunks
+    ).apply_async(queue='pool_solo')
+    return {"chunks": len(chunks), "group_id": res.id}
+
+
+@app.task(base=CandleTask, bind=True, max_retries=3)
+def backfill_chunk(self: task, chunk_id: int, symbol: str, period: int, ctm_from: int, ctm_until: int):
+    """Worker task to collect one backfill chunk, then advance candles stats - date_from"""
+
+    symbol_id: int = self.symbol_ids.get(symbol)
+    period_id: int = self.period_ids.get(period)
+
+    try:
+        with self.session() as client:
+            res = client.get_chart_range_request(symbol, period, ctm_from // 1000, ctm_until // 1000, 0)
+    except (CommandFailed, SocketError) as err:
+        if self.request.retries >= self.max_retries:
+            finish_backfill_chunk(chunk_id, "failed")
+        raise self.retry(exc=err, countdown=10 * 2 ** self.request.retries)
+
+    candles, digits = decode_chart(res)
+    rowcount = upsert_candles(symbol_id, period_id, candles)
+    finish_backfill_chunk(chunk_id, "done", rowcount)
+    ct = query_ct(symbol_id, period_id)
+    _derive_candles(self, ct, Candles.empty(), candles, digits)
+
+    # advance date_from over contiguous done chunks only
+    date_from = contiguous_date_from(ct, query_backfill_chunks(symbol_id, period_id))
+    if date_from < ct.date_from:
+        extend_ct_date_from(symbol_id, period_id, date_from)
+
+    return {
+        "chunk": chunk_id,
+        "inserted": rowcount,
+        "date_from": str(min(date_from, ct.date_from)),
+    }
+
+
+def _ta_frame(candles: dict[str, list], digits: int):
+    """Return: DataFrame of columnar candles sorted by ctm, prices from points"""
+    # pandas & pandas_ta take seconds to import, only TA workers need them
+    from pandas import DataFrame
+    import pandas_ta  # noqa: F401, registers DataFrame.ta
+
+    df = DataFrame(candles).sort_values('ctm', ignore_index=True)
     df['close'] = (df['open'] + df['close']) / 10 ** digits
     df['high'] = (df['open'] + df['high']) / 10 ** digits
     df['low'] = (df['open'] + df['low']) / 10 ** digits
     df['open'] = df['open'] / 10 ** digits
-    # apply strategy
-    ta = presets.get(strategy, [])
-    df.ta.strategy(Strategy(name=strategy, ta=ta))
-    df.dropna(inplace=True, ignore_index=True)
-    # filter columns
-    cols = df.columns.to_list()
-    dropped_cols = ['ctm', 'ctmString', 'open', 'close', 'high', 'low', 'vol']
-    selected_cols = [c for c in cols if c not in dropped_cols]
+    return df
+
+
+def _upsert_strategy(
+        db: Database,
+        strategy: str,
+        df,
+        symbol_id: int,
+        period_id: int,
+        last_update: datetime
+) -> dict:
+    """Upsert TA results of strategy, ctm & indicator columns, and push the latest one"""
+    if not len(df):
+        return {}
+    selected_cols = df.columns.to_list()[1:]
     # additional columns
     df['symbol_code'] = symbol_id * 10 + period_id
     df['id'] = df['ctm'] + symbol_id * 10 + period_id
-    df['last_update'] = datetime.now(timezone.utc)
+    df['last_update'] = last_update
     # final columns
     final_cols = ['id', 'symbol_code'] + selected_cols + ['last_update']
     res = bulk_upsert(
             db, collection=strategy,
             data=df[final_cols].to_dict(orient='records')
     )
+    last = df.iloc[-1]
+    publish_ta(strategy, symbol_id, period_id, int(last['ctm']), {c: float(last[c]) for c in selected_cols})
+    return res
+
+
+@app.task(base=TATask, bind=True)
+def upsert_technical_analysis(
+        self: task,
+        strategy: str,
+        symbol_id: int,
+        period_id: int,
+        digits: int,
+        candles: dict[str, list],
+):
+    """Worker task to upsert TA results by symbol & period"""
+    indicators = Indicators(_ta_frame(candles, digits))
+    df = indicators.preset(self.presets.get(strategy, []))
+    res = _upsert_strategy(self.db, strategy, df, symbol_id, period_id, datetime.now(timezone.utc))
     return {
         "nInserted": res.get("nInserted", 0),
         "symbol": symbol_id * 10 + period_id,
         "strategy": strategy,
     }
+
+
+@app.task(base=TATask, bind=True)
+def upsert_all_technical_analysis(
+        self: task,
+        symbol_id: int,
+        period_id: int,
+        digits: int,
+        candles: dict[str, list],
+        strategies: list[str] | None = None,
+):
+    """Worker task to upsert TA results of every preset by symbol & period,
+    from one candle frame, repeated indicator entries computed once"""
+    indicators = Indicators(_ta_frame(candles, digits))
+    last_update = datetime.now(timezone.utc)
+    inserted = {}
+    for strategy in strategies or self.presets:
+        df = indicators.preset(self.presets.get(strategy, []))
+        res = _upsert_strategy(self.db, strategy, df, symbol_id, period_id, last_update)
+        inserted[strategy] = res.get("nInserted", 0)
+    return {
+        "nInserted": inserted,
+        "symbol": symbol_id * 10 + period_id,
+    }
@@ -1,10 +1,13 @@
 import os
+from contextlib import contextmanager
 from celery import Celery, Task
-from pymongo import MongoClient
 from pymongo.database import Database
 from .config import Config
-from .spider.exchange import Exchange
+from .database import mongo_client
+from .spider.exchange import Exchange, account, pool_accounts
 from .spider.XTBApi import Client
+from .spider.session import SessionPool, get_pool
+from .spider.bars import derive_plan
 
 app = Celery(
     __name__,
@@ -13,7 +16,14 @@ app = Celery(
     include=['project.spider.tasks'],
     task_routes={
         "project.spider.tasks.collect_candles": {"queue": "pool_solo"},
-        "project.spider.tasks.upsert_technical_analysis": {"queue": "pool_any"}
+        "project.spider.tasks.collect_all_candles": {"queue": "pool_solo"},
+        "project.spider.tasks.plan_backfill": {"queue": "pool_solo"},
+        "project.spider.tasks.backfill_chunk": {"queue": "pool_solo"},
+        "project.spider.tasks.sync_server_time": {"queue": "pool_solo"},
+        "project.spider.tasks.maintain_partitions": {"queue": "pool_solo"},
+        "project.spider.tasks.check_resample": {"queue": "pool_solo"},
+        "project.spider.tasks.upsert_technical_analysis": {"queue": "pool_any"},
+        "project.spider.tasks.upsert_all_technical_analysis": {"queue": "pool_any"}
     },
     task_cls=Exchange
 )
@@ -26,29 +36,41 @@ class XTBClientTask(Task):
     @property
     def client(self):
         if not self._client:
-            token = Exchange.ACCOUNTS.get(self.user, {}).get('pass', '')
-            self._client = Client(self.user, token=token, mode='real')
+            token = account(self.user).get('pass', '')
+            self._client = Client(self.user, token=token, mode='real', url=Config.XTB_URL or None)
             self._client.login()
+            self._client.start_keepalive()
         return self._client
 
+    @property
+    def pool(self) -> SessionPool:
+        return get_pool(pool_accounts(), url=Config.XTB_URL or None)
+
+    @contextmanager
+    def session(self, cost: float = 1):
+        """Client of this worker's account, or one from the pool if XTB_POOL is set"""
+        if not Config.XTB_POOL:
+            yield self.client
+            return
+        with self.pool.acquire(cost) as client:
+            yield client
+
 
 class MongoDBTask(Task):
     db_name: str = Config.MONGODB_NAME
-    _client: MongoClient | None = None
-    _db: Database | None = None
 
     @property
-    def db(self):
-        if self._db is None:
-            self._client = MongoClient(Config.MONGO_URI)
-            self._db = self._client[self.db_name]
-        return self._db
+    def db(self) -> Database:
+        return mongo_client()[self.db_name]
 
 
 class CandleTask(XTBClientTask):
     symbol_ids: dict[str, int] = Exchange.SYMBOL_ID
     period_ids: dict[int, int] = Exchange.PERIOD_ID
     presets: dict[str, list] = Exchange.PRESETS
+    derive_plan: dict[str, tuple[int, list[int]]] = derive_plan(
+        Exchange.SYMBOL_DEFAULT + Exchange.SYMBOL_SUBSCRIBE, Exchange.RESAMPLE_PERIODS
+    )
 
 
 class TATask(MongoDBTask):
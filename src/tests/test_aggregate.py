@@ -0,0 +1,39 @@
+"""Bucket validation of the /aggregate roll-up.
+
+Usage (from src/):
+    python -m pytest tests
+"""
+import pytest
+
+from project.spider.bars import aggregation_base
+from project.spider.crud import rollup_candles
+from project.spider.exchange import Exchange
+
+PAIRS = (('GOLD', 1), ('GOLD', 5), ('GOLD', 15), ('GOLD', 240))
+
+
+def test_aggregation_base():
+    assert aggregation_base(PAIRS, 'GOLD', 30) == 15
+    assert aggregation_base(PAIRS, 'GOLD', 7) == 1
+    assert aggregation_base(PAIRS, 'EURUSD', 30) is None
+
+
+@pytest.mark.parametrize("bucket", [0, -15])
+def test_non_positive_bucket(bucket):
+    with pytest.raises(ValueError):
+        aggregation_base(PAIRS, 'GOLD', bucket)
+    with pytest.raises(ValueError):
+        rollup_candles(next(iter(Exchange.SYMBOL_ID.values())), bucket, 0, 3_600_000)
+
+
+@pytest.mark.parametrize("bucket", [0, -15])
+def test_route_non_positive_bucket(bucket):
+    pytest.importorskip("httpx")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from project.spider.route import router
+
+    app = FastAPI()
+    app.include_router(router, prefix="/candles")
+    res = TestClient(app).get(f"/candles/aggregate/1/{bucket}", params={"to": 3_600_000})
+    assert res.status_code == 422
@@ -0,0 +1,57 @@
+"""Preset indicators against pandas_ta's own strategy run.
+
+Usage (from src/):
+    python -m pytest tests
+"""
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+ta = pytest.importorskip("pandas_ta")
+
+from project.spider.exchange import Exchange  # noqa: E402
+from project.spider.indicators import Indicators  # noqa: E402
+
+BASE_COLUMNS = ['ctm', 'open', 'close', 'high', 'low', 'vol']
+
+
+def _candles(n: int = 300, seed: int = 7) -> pd.DataFrame:
+    """Return: random walk candles in the TA task frame layout, absolute prices."""
+    rng = np.random.default_rng(seed)
+    close = 2000 + np.cumsum(rng.normal(0, 2, n))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = rng.uniform(0, 3, n)
+    return pd.DataFrame({
+        'ctm': np.arange(n, dtype=np.int64) * 900_000,
+        'open': open_,
+        'close': close,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+        'vol': rng.integers(0, 5000, n).astype(float),
+    })
+
+
+def _strategy(df: pd.DataFrame, name: str, preset: list[dict]) -> pd.DataFrame:
+    """Return: ctm & indicator columns as the per-preset task computed them, with df.ta.strategy."""
+    df = df.copy()
+    df.ta.cores = 0
+    df.ta.strategy(ta.Strategy(name=name, ta=preset))
+    df.dropna(inplace=True, ignore_index=True)
+    return df[['ctm'] + [c for c in df.columns if c not in BASE_COLUMNS]]
+
+
+@pytest.mark.parametrize("name", list(Exchange.PRESETS))
+def test_preset_matches_strategy(name):
+    df = _candles()
+    preset = Exchange.PRESETS[name]
+    expected = _strategy(df, name, preset)
+    got = Indicators(df).preset(preset)
+    assert got.columns.to_list() == expected.columns.to_list()
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False, check_names=False, rtol=1e-9)
+
+
+def test_repeated_entries_computed_once():
+    indicators = Indicators(_candles())
+    for preset in list(Exchange.PRESETS.values()) * 2:
+        indicators.preset(preset)
+    assert len(indicators._memo) == len(Exchange.PRESETS)
@@ -0,0 +1,64 @@
+"""XTB client commands against the local FakeXTB server.
+
+Usage (from src/):
+    python -m pytest tests
+"""
+import asyncio
+from datetime import date
+
+import pytest
+
+from project.config import Config
+from project.spider.fakextb import FakeXTBServer
+from project.spider.schemas import CandleStatBase
+from project.spider.tasks import _gather_all
+from project.spider.XTBApi import STATUS, AsyncClient, Client, CommandFailed
+
+
+@pytest.fixture(scope="module")
+def fake():
+    server = FakeXTBServer(latency=0.0, jitter=0.0).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(fake):
+    client = Client('test', token='', mode='real', url=fake.url)
+    client.login()
+    yield client
+    client.close()
+
+
+def test_pipelined_empty(client):
+    commands = client.commands
+    assert client.get_chart_range_requests([]) == []
+    assert client.commands == commands
+
+
+def test_pipelined_in_order(client):
+    infos = [('GOLD', 15, 1_700_000_000, 1_700_000_000, -3), ('EURUSD', 60, 1_700_000_000, 1_700_000_000, -5)]
+    responses = client.get_chart_range_requests(infos)
+    assert [len(res['returnData']['rateInfos']) for res in responses] == [3, 5]
+
+
+def test_async_login_failed_closes(fake):
+    async def run():
+        client = AsyncClient('', token='', mode='real', url=fake.url)
+        with pytest.raises(CommandFailed):
+            await client.login()
+        return client
+    client = asyncio.run(run())
+    assert client.ws is None and client._reader is None
+    assert client.status == STATUS.NOT_LOGGED
+
+
+def test_gather_all_keeps_healthy_accounts(fake, monkeypatch):
+    monkeypatch.setattr(Config, 'XTB_URL', fake.url)
+    cts = [
+        CandleStatBase(symbol_id=i, timeframe_id=1, symbol=symbol, period=15, digits=0,
+                       date_from=date.today(), date_until=date.today())
+        for i, symbol in enumerate(['GOLD', 'EURUSD', 'OIL', 'US500'])
+    ]
+    results = asyncio.run(_gather_all({'test': {}, '': {}}, cts))
+    assert [len(candles) > 0 for candles, _ in results] == [True, False, True, False]